@@ -0,0 +1,206 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from initial import PARAMETER_GRIDS, make_model, parameter_candidates
+from packed_forest import CompiledForest, PackedBits, is_compilable
+
+TRAINERS = ["Decision Tree", "Bagging", "Random Forest", "Boosting", "Hist Boosting"]
+PARALLEL = {"Bagging", "Random Forest", "Hist Boosting"} # the rest only ever use one core
+
+
+def make_cnf_dataset(clauses, examples, variables=None, width=3, seed=0, chunk_rows=10000):
+    """Random assignments to a random width-CNF formula, as uint8 (X, y).
+
+    variables defaults to clauses, the same shape as the clause datasets. An example is positive if it
+    satisfies at least the median number of clauses, so the classes are balanced at every size while the
+    label still depends on the clause structure.
+    """
+    variables = variables or clauses
+    rng = np.random.default_rng(seed)
+    literals = rng.integers(0, variables, (clauses, width))
+    negated = rng.random((clauses, width)) < 0.5
+    X = np.empty((examples, variables), dtype=np.uint8)
+    satisfied = np.empty(examples, dtype=np.int32)
+    for start in range(0, examples, chunk_rows): # a chunk at a time, the clause tensor is rows x clauses x width
+        rows = min(chunk_rows, examples - start)
+        X[start:start + rows] = rng.integers(0, 2, (rows, variables), dtype=np.uint8)
+        satisfied[start:start + rows] = (X[start:start + rows][:, literals].astype(bool) ^ negated).any(axis=2).sum(axis=1)
+    return X, (satisfied >= np.median(satisfied)).astype(np.uint8)
+
+
+def benchmark_settings(name, full_grid=False):
+    """Every grid candidate, or by default just the most expensive one (most estimators, deepest trees,
+    all features and samples), which is the one that sizes the hardware."""
+    if full_grid:
+        return parameter_candidates(name)
+    grid = PARAMETER_GRIDS[name][False]
+    slowest = {}
+    for key, values in grid.items():
+        if key == "max_depth":
+            slowest[key] = None if None in values else max(values)
+        elif key in ("criterion", "splitter"):
+            slowest[key] = values[0]
+        else:
+            slowest[key] = max(values)
+    return [slowest]
+
+
+def time_trainer(name, params, cores, X_train, y_train, X_test, X_test_packed, repeats=1):
+    """Best-of-repeats fit and predict seconds for one trainer, setting and core count."""
+    fit_s = predict_s = packed_s = float("inf")
+    for _ in range(repeats):
+        model = make_model(name, params, n_jobs=cores)
+        with threadpool_limits(limits=cores, user_api="openmp"):
+            start = time.perf_counter()
+            model.fit(X_train, y_train)
+            fit_s = min(fit_s, time.perf_counter() - start)
+            start = time.perf_counter()
+            model.predict(X_test)
+            predict_s = min(predict_s, time.perf_counter() - start)
+            if is_compilable(model):
+                start = time.perf_counter()
+                CompiledForest(model).predict(X_test_packed) # build included, a search model is predicted once
+                packed_s = min(packed_s, time.perf_counter() - start)
+    return fit_s, predict_s, packed_s if packed_s != float("inf") else None
+
+
+def run_benchmark(trainers, clause_counts, example_sizes, core_counts, variables=None, test_examples=5000,
+                  full_grid=False, repeats=1, time_limit=600.0, seed=0):
+    """Time every trainer x setting x core count x (clauses, examples). Returns one row per measurement.
+
+    Sizes go smallest first, and once a fit takes longer than time_limit the bigger sizes for that
+    trainer/setting/cores are skipped rather than left running for hours. Skipped sizes still get a row,
+    with skipped=True and no timings.
+    """
+    rows = []
+    too_slow = set()
+    for c in clause_counts:
+        for d in sorted(example_sizes):
+            X, y = make_cnf_dataset(c, d + test_examples, variables, seed=seed)
+            X_train, y_train = X[:d].astype(np.float32), y[:d]
+            X_test = X[d:].astype(np.float32)
+            X_test_packed = PackedBits.from_dense(X[d:])
+            del X
+            for name in trainers:
+                for params in benchmark_settings(name, full_grid):
+                    for cores in (core_counts if name in PARALLEL else [1]):
+                        job = (name, str(params), cores, c)
+                        if job in too_slow:
+                            print(f"{name:<14} c={c:<5} d={d:<7} cores={cores:<3} skipped, smaller size exceeded the time limit")
+                            rows.append({"trainer": name, "params": str(params), "cores": cores, "clauses": c,
+                                         "variables": X_train.shape[1], "examples": d, "fit_s": np.nan,
+                                         "predict_s": np.nan, "packed_predict_s": None,
+                                         "predict_rows": len(X_test), "skipped": True})
+                            continue
+                        fit_s, predict_s, packed_s = time_trainer(name, params, cores, X_train, y_train, X_test,
+                                                                  X_test_packed, repeats)
+                        rows.append({"trainer": name, "params": str(params), "cores": cores, "clauses": c,
+                                     "variables": X_train.shape[1], "examples": d, "fit_s": fit_s,
+                                     "predict_s": predict_s, "packed_predict_s": packed_s,
+                                     "predict_rows": len(X_test), "skipped": False})
+                        print(f"{name:<14} c={c:<5} d={d:<7} cores={cores:<3} fit {fit_s:9.3f}s predict {predict_s:8.3f}s"
+                              + (f" packed {packed_s:8.3f}s" if packed_s is not None else ""))
+                        if fit_s > time_limit:
+                            too_slow.add(job)
+    return pd.DataFrame(rows)
+
+
+def _row_exponent(fit_seconds):
+    measured = fit_seconds.dropna()
+    if len(measured) < 2:
+        return np.nan
+    (small, small_s), (large, large_s) = measured.iloc[-2:].items()
+    return np.log(large_s / small_s) / np.log(large / small)
+
+
+def scaling_table(results, max_exponent=1.5):
+    """Fit seconds with one column per example count, plus the log-log slope between each row's two
+    largest measured sizes. A slope above max_exponent means fit time is growing faster than expected
+    and is flagged, and so is a row whose bigger sizes were skipped for exceeding the time limit."""
+    index = ["trainer", "params", "cores", "clauses"]
+    skipped = results["skipped"].astype(bool) if "skipped" in results else pd.Series(False, index=results.index)
+    table = results[~skipped].pivot_table(index=index, columns="examples", values="fit_s")
+    table = table.reindex(columns=sorted(results["examples"].unique())) # skipped sizes stay as NaN columns
+    table["exponent"] = table.apply(_row_exponent, axis=1)
+    over_budget = results[skipped].groupby(index).size()
+    table["over_budget"] = table.index.isin(over_budget.index)
+    table["superlinear"] = (table["exponent"] > max_exponent) | table["over_budget"]
+    return table
+
+
+def plot_scaling(results, plot_dir):
+    """One figure per trainer: fit and predict time against examples, log-log, a line per clauses/cores."""
+    import matplotlib
+    matplotlib.use("Agg") # no display needed
+    import matplotlib.pyplot as plt
+
+    os.makedirs(plot_dir, exist_ok=True)
+    paths = []
+    for (name, params), group in results.groupby(["trainer", "params"]):
+        fig, axes = plt.subplots(1, 2, figsize=(12, 4.5))
+        for (c, cores), line in group.groupby(["clauses", "cores"]):
+            line = line.sort_values("examples")
+            axes[0].plot(line["examples"], line["fit_s"], marker="o", label=f"c={c}, cores={cores}")
+            axes[1].plot(line["examples"], line["predict_s"], marker="o", label=f"c={c}, cores={cores}")
+        for ax, title in zip(axes, ["fit", f"predict ({group['predict_rows'].iloc[0]} rows)"]):
+            ax.set_xscale("log")
+            ax.set_yscale("log")
+            ax.set_xlabel("training examples")
+            ax.set_ylabel("seconds")
+            ax.set_title(title)
+            ax.legend(fontsize=8)
+        fig.suptitle(f"{name} {params}", fontsize=10)
+        plt.tight_layout()
+        stem = name.lower().replace(" ", "_")
+        settings = sum(1 for path in paths if os.path.basename(path).startswith(stem + "_"))
+        path = os.path.join(plot_dir, f"{stem}_{settings}.png") # one per setting with --full-grid
+        fig.savefig(path)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time fit and predict of the ensemble trainers on synthetic CNF datasets.")
+    parser.add_argument("--trainers", nargs="+", choices=TRAINERS, default=TRAINERS)
+    parser.add_argument("--clauses", nargs="+", type=int, default=[300, 1800])
+    parser.add_argument("--examples", nargs="+", type=int, default=[1000, 5000, 20000, 100000])
+    parser.add_argument("--cores", nargs="+", type=int, default=sorted({1, os.cpu_count() or 1}),
+                        help="core counts for bagging, random forest and hist boosting")
+    parser.add_argument("--variables", type=int, help="features per example, the clause count by default")
+    parser.add_argument("--test-examples", type=int, default=5000)
+    parser.add_argument("--full-grid", action="store_true", help="time every grid candidate, not just the slowest")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--time-limit", type=float, default=600.0, help="skip bigger sizes once a fit takes this long")
+    parser.add_argument("--max-exponent", type=float, default=1.5, help="flag fit times growing faster than this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="ensemble_benchmark.csv")
+    parser.add_argument("--plot-dir", default="ensemble_benchmark_plots")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.trainers, args.clauses, args.examples, args.cores, args.variables,
+                            args.test_examples, args.full_grid, args.repeats, args.time_limit, args.seed)
+    results.to_csv(args.output, index=False)
+    print(f"Wrote {args.output}")
+
+    table = scaling_table(results, args.max_exponent)
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 250):
+        print(table)
+    table.to_csv(os.path.splitext(args.output)[0] + "_scaling.csv")
+    for path in plot_scaling(results, args.plot_dir):
+        print(f"Wrote {path}")
+    if table["superlinear"].any():
+        print(f"Fit time grows faster than examples^{args.max_exponent}, or exceeded the time limit, for:")
+        flagged = table[table["superlinear"]]
+        print(flagged.index.to_frame(index=False).assign(exponent=flagged["exponent"].values,
+                                                         over_budget=flagged["over_budget"].values)
+              .to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import warnings
+from functools import lru_cache
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingClassifier
+
+try:
+    # private, requirements.txt pins the scikit-learn versions this was checked against
+    from sklearn.ensemble._hist_gradient_boosting.binning import _BinMapper
+except ImportError:
+    _BinMapper = None
+
+
+class BinnedData:
+    """A feature matrix binned once: the fitted _BinMapper plus the uint8 bin code of every row.
+
+    Every candidate and fold fit on (a subset of) these rows reuses the codes instead of finding the
+    bin thresholds and binning the data again, which is what HistGradientBoostingClassifier.fit does.
+    """
+
+    def __init__(self, X, max_bins=255, random_state=69):
+        X = np.asarray(X, dtype=np.float64)
+        self.mapper = _BinMapper(n_bins=max_bins + 1, random_state=random_state).fit(X)
+        self.codes = self.mapper.transform(X) # Fortran ordered, the layout the histograms are built from
+        self.max_bins = max_bins
+
+    def transform(self, X):
+        """Bin codes for new rows of the same features (e.g. the validation set)."""
+        return np.ascontiguousarray(self.mapper.transform(np.asarray(X, dtype=np.float64)))
+
+
+class SharedBinsHistGradientBoosting(HistGradientBoostingClassifier):
+    """HistGradientBoostingClassifier that can be fit straight from a BinnedData with fit_binned().
+
+    A normal fit() still works and bins X itself. predict() takes raw features either way, since the
+    model keeps the shared mapper's thresholds. fit_binned relies on sklearn internals, callers check
+    shared_bins_supported() first and use fit() when it's False.
+    """
+
+    def fit_binned(self, binned, y, rows=None, valid_codes=None, y_valid=None):
+        """Fit on binned.codes[rows] (all rows by default).
+
+        valid_codes/y_valid are the already binned early-stopping set. Without them early stopping is
+        turned off, an internal validation split would need the raw rows.
+        """
+        if self.max_bins != binned.max_bins:
+            raise ValueError(f"max_bins={self.max_bins} but the data was binned with max_bins={binned.max_bins}")
+        codes = binned.codes if rows is None else np.asfortranarray(binned.codes[rows])
+        early_stopping = self.early_stopping
+        if valid_codes is None:
+            self.early_stopping = False
+        self._shared_bins = (binned.mapper, codes, valid_codes)
+        try:
+            # fit() only validates X before binning it, and _bin_data below hands back the codes instead,
+            # so a zero-stride placeholder stands in for the raw rows without allocating them
+            placeholder = np.broadcast_to(np.float64(0), codes.shape)
+            if valid_codes is None:
+                return self.fit(placeholder, y)
+            return self.fit(placeholder, y, X_val=np.broadcast_to(np.float64(0), valid_codes.shape), y_val=y_valid)
+        finally:
+            del self._shared_bins
+            self.early_stopping = early_stopping
+
+    def _bin_data(self, X, sample_weight, is_training_data):
+        shared = getattr(self, "_shared_bins", None)
+        if shared is None:
+            return super()._bin_data(X, sample_weight, is_training_data)
+        mapper, codes, valid_codes = shared
+        self._bin_mapper = mapper
+        return codes if is_training_data else valid_codes
+
+
+@lru_cache(maxsize=None)
+def shared_bins_supported():
+    """Whether fit_binned can be trusted with the installed scikit-learn, checked once per process.
+
+    fit_binned leans on sklearn internals (_BinMapper and the _bin_data hook), so this fits a small
+    problem from shared bins and as a plain HistGradientBoostingClassifier and requires the same
+    iterations and probabilities. When it fails, callers fit the plain way instead.
+    """
+    if _BinMapper is None:
+        warnings.warn("sklearn has no _BinMapper, hist boosting falls back to binning on every fit")
+        return False
+    rng = np.random.default_rng(0)
+    X = rng.random((400, 6))
+    y = (X[:, 0] + X[:, 1] * rng.random(400) > 0.8).astype(int)
+    X_fit, y_fit, X_val, y_val = X[:300], y[:300], X[300:], y[300:]
+    params = {"max_iter": 30, "max_depth": 3, "early_stopping": True, "n_iter_no_change": 3, "random_state": 0}
+    try:
+        plain = HistGradientBoostingClassifier(**params).fit(X_fit, y_fit, X_val=X_val, y_val=y_val)
+        binned = BinnedData(X_fit, random_state=0)
+        shared = SharedBinsHistGradientBoosting(**params).fit_binned(binned, y_fit, valid_codes=binned.transform(X_val),
+                                                                     y_valid=y_val)
+        supported = plain.n_iter_ == shared.n_iter_ and np.allclose(plain.predict_proba(X), shared.predict_proba(X))
+    except Exception: # an internal signature changed
+        supported = False
+    if not supported:
+        warnings.warn("fit_binned doesn't match HistGradientBoostingClassifier with this scikit-learn, "
+                      "hist boosting falls back to binning on every fit")
+    return supported
@@ -1,22 +1,99 @@
 
+import argparse
+import copy
+import hashlib
+import json
 import os
+import pickle
+import sys
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.metrics import accuracy_score
 from sklearn.metrics import f1_score
 import pandas as pd
 from itertools import product
-from sklearn.ensemble import BaggingClassifier, RandomForestClassifier, GradientBoostingClassifier
-from sklearn.datasets import fetch_openml
-from sklearn.model_selection import train_test_split
+from sklearn.ensemble import BaggingClassifier, RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.model_selection import StratifiedKFold, train_test_split
 import numpy as np
-
-
-def load_dataset(clauses, examples, data_dir):
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from threadpoolctl import threadpool_limits
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+from hist_boosting import BinnedData, SharedBinsHistGradientBoosting, shared_bins_supported
+from result_store import ResultStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")) # mnist_store, atomic_files
+from atomic_files import save_cache, save_json
+from mnist_store import load_mnist, scaled
+from joblib import effective_n_jobs
+from packed_forest import PackedBits, compiled_forest, is_compilable, pack_if_binary
+
+
+DATASET_CACHE_VERSION = 1 # bump when the cached array layout changes
+
+def dataset_cache_dir(data_dir):
+    return os.path.join(data_dir, "dataset_cache")
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cached_split(csv_path, cache_dir):
+    """Memory-mapped (X, y, sha256) for one clause CSV, parsing it only the first time.
+
+    The 0/1 features and labels are stored as uint8 .npy files in cache_dir, so later loads are a
+    zero-copy np.load(mmap_mode="r") and every process reading the same file shares one copy in the
+    page cache. The cache is rebuilt when the CSV's sha256 changes; the file is only rehashed when its
+    size or mtime differ from what was recorded.
+    """
+    stem = os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+    stat = os.stat(csv_path)
+    meta = None
+    if os.path.exists(stem + ".json"):
+        with open(stem + ".json") as f:
+            meta = json.load(f)
+        if meta.get("version") != DATASET_CACHE_VERSION:
+            meta = None
+        elif (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            if _file_sha256(csv_path) == meta["sha256"]:
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns) # touched, not changed
+            else:
+                meta = None
+            if meta is not None:
+                save_json(stem + ".json", meta)
+
+    if meta is None:
+        sha256 = _file_sha256(csv_path)
+        data = pd.read_csv(csv_path, header=None, dtype=np.uint8).to_numpy()
+        os.makedirs(cache_dir, exist_ok=True)
+        meta = {"version": DATASET_CACHE_VERSION, "sha256": sha256, "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns, "shape": list(data.shape)}
+        save_cache({stem + ".X.npy": np.ascontiguousarray(data[:, :-1]),
+                    stem + ".y.npy": np.ascontiguousarray(data[:, -1])}, stem + ".json", meta)
+
+    return np.load(stem + ".X.npy", mmap_mode="r"), np.load(stem + ".y.npy", mmap_mode="r"), meta["sha256"]
+
+def load_dataset(clauses, examples, data_dir, cache_dir=None):
+    """Train, validation and test splits for one clause dataset.
+
+    Without cache_dir these are pandas DataFrames/Series parsed from the CSVs. With cache_dir they are
+    read-only uint8 memmaps from cached_split, which skips the CSV parse after the first load.
+    """
     #"C:\\Users\\alech\\PycharmProjects\\decisionTreesAndEnsemble\\project2_data\\all_data"
     train_file = f"train_c{clauses}_d{examples}.csv"
     valid_file = f"valid_c{clauses}_d{examples}.csv"
     test_file = f"test_c{clauses}_d{examples}.csv"
 
+    if cache_dir is not None:
+        splits = [cached_split(os.path.join(data_dir, name), cache_dir)[:2] for name in (train_file, valid_file, test_file)]
+        return tuple(array for split in splits for array in split)
+
     train_df = pd.read_csv(os.path.join(data_dir, train_file), header=None)
     valid_df = pd.read_csv(os.path.join(data_dir, valid_file), header=None)
     test_df = pd.read_csv(os.path.join(data_dir, test_file), header=None)
@@ -33,187 +110,691 @@ def evaluate_model(best_model, X_test, y_test):
     f1 = f1_score(y_test, y)
     return accuracy, f1
 
-def train_bagging_classifier(X_train, y_train, X_valid, y_valid, multiclass=False):
-
-    parameter_grid = {
-        "n_estimators": [10, 25],
-        "max_samples": [1.0, 0.75],
-        "max_features": [1.0]
-    }
-
-    if not multiclass:
-        parameter_grid = {
+# Hyperparameter grids for each classifier: the full grid for the clause datasets and a smaller one for MNIST
+PARAMETER_GRIDS = {
+    "Decision Tree": {
+        False: {
+            "criterion": ["entropy", "gini"],
+            "splitter": ["best", "random"],
+            "max_depth": [None, 10, 25, 50],
+        },
+        True: {
+            "criterion": ["entropy"],
+            "splitter": ["best"],
+            "max_depth": [10, 25],
+        },
+    },
+    "Bagging": {
+        False: {
             "n_estimators": [10, 25, 50],
             "max_samples": [0.5, 0.75, 1.0],
             "max_features": [0.5, 0.75, 1.0]
-        }
-
-    best_model = None
-    best_params = None
-    best_f1 = 0
-
-    for n_estimators, max_samples, max_features in product(parameter_grid["n_estimators"],
-                                                           parameter_grid["max_samples"],
-                                                           parameter_grid["max_features"]):
-        model = BaggingClassifier(estimator=DecisionTreeClassifier(criterion="gini", splitter="best", max_depth=None),n_estimators=n_estimators, max_samples=max_samples, max_features=max_features, random_state=69, n_jobs=-1)
-
-    # use gini because slightly faster, best because bagging already adds randomness compared to using random, use max_depth=None because
-        #bagging reduces variance, overfitting and can capture more complex patterns
-
-        model.fit(X_train, y_train) # Train using only training data
-        y_pred = model.predict(X_valid) # Evaluate on the validation data by getting predicted value
-
-        if multiclass:
-            f1 = f1_score(y_valid, y_pred, average='weighted')  # Use F1-score as selection criteria
-        else:
-            f1 = f1_score(y_valid, y_pred)
-
-        if f1 > best_f1:
-            best_f1 = f1
-            best_model = model
-            best_params = {
-                "n_estimators": n_estimators,
-                "max_samples": max_samples,
-                "max_features": max_features
-            }
-    return best_model, best_params
-
-
-
-def train_random_forest(X_train, y_train, X_valid, y_valid, multiclass=False):
-
-    parameter_grid = {
-        "n_estimators": [10, 25],
-        "max_depth": [10, 25],
-        "max_features": [1.0],
-    }
-
-    if not multiclass:
-        parameter_grid = {
+        },
+        True: {
+            "n_estimators": [10, 25],
+            "max_samples": [1.0, 0.75],
+            "max_features": [1.0]
+        },
+    },
+    "Random Forest": {
+        False: {
             "n_estimators": [10, 25, 50],
             "max_depth": [None, 10, 25],
             "max_features": [0.5, 0.75, 1.0]
-        }
-
-    # "n_estimators": [10, 25, 50],
-    # "max_depth": [None, 10, 25],
-    # "max_features": [0.5, 0.75, 1.0],
-
-    best_model = None
-    best_params = None
-    best_f1 = 0
-
-    for n_estimators, max_depth, max_features in product(parameter_grid["n_estimators"],
-                                                           parameter_grid["max_depth"],
-                                                           parameter_grid["max_features"],
-                                                         ):
-        model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, max_features=max_features, random_state=69, n_jobs=-1)
-
-        model.fit(X_train, y_train) # Train using only training data
-        y_pred = model.predict(X_valid) # Evaluate on the validation data by getting predicted value
-
-        if multiclass:
-            f1 = f1_score(y_valid, y_pred, average='weighted')  # Use F1-score as selection criteria
-        else:
-            f1 = f1_score(y_valid, y_pred)
-
-
-        if f1 > best_f1:
-            best_f1 = f1
-            best_model = model
-            best_params = {
-                "n_estimators": n_estimators,
-                "max_depth": max_depth,
-                "max_features": max_features,
-
-            }
-
-    return best_model, best_params
-
-def train_boosting_classifier(X_train, y_train, X_valid, y_valid, multiclass=False):
-
-    parameter_grid = {
-        "n_estimators": [100],
-        "learning_rate": [0.1],
-        "max_depth": [3]
-    }
-
-    if not multiclass:
-        parameter_grid = {
+        },
+        True: {
+            "n_estimators": [10, 25],
+            "max_depth": [10, 25],
+            "max_features": [1.0],
+        },
+    },
+    "Boosting": {
+        False: {
             "n_estimators": [100, 250],
             "learning_rate": [0.1, 0.5],
             "max_depth": [3, 5]
-        }
-
-
-    best_model = None
-    best_params = None
-    best_f1 = 0
-
-    for n_estimators, learning_rate, max_depth, in product(parameter_grid["n_estimators"],
-                                                           parameter_grid["learning_rate"],
-                                                           parameter_grid["max_depth"],
-                                                         ):
-        model = GradientBoostingClassifier(n_estimators=n_estimators, max_depth=max_depth, learning_rate=learning_rate, random_state=69)
-
-        model.fit(X_train, y_train) # Train using only training data
-        y_pred = model.predict(X_valid) # Evaluate on the validation data by getting predicted value
-
-        if multiclass:
-            f1 = f1_score(y_valid, y_pred, average='weighted')  # Use F1-score as selection criteria
+        },
+        True: {
+            "n_estimators": [100],
+            "learning_rate": [0.1],
+            "max_depth": [3]
+        },
+    },
+    # HistGradientBoostingClassifier, n_estimators is its max_iter and the validation set stops it early
+    "Hist Boosting": {
+        False: {
+            "n_estimators": [100, 250],
+            "learning_rate": [0.1, 0.5],
+            "max_depth": [3, 5]
+        },
+        True: {
+            "n_estimators": [100],
+            "learning_rate": [0.1],
+            "max_depth": [3, 5]
+        },
+    },
+}
+
+def parameter_candidates(name, multiclass=False):
+    """Every parameter combination in the grid, in the same order the nested loops used to visit them."""
+    grid = PARAMETER_GRIDS[name][multiclass]
+    return [dict(zip(grid.keys(), values)) for values in product(*grid.values())]
+
+def make_model(name, params, n_jobs=-1):
+    """Unfitted model for one grid candidate. n_jobs only applies to bagging and random forest."""
+    if name == "Decision Tree":
+        return DecisionTreeClassifier(**params, random_state=69)
+    if name == "Bagging":
+        # use gini because slightly faster, best because bagging already adds randomness compared to using random, use max_depth=None because
+        #bagging reduces variance, overfitting and can capture more complex patterns
+        return BaggingClassifier(estimator=DecisionTreeClassifier(criterion="gini", splitter="best", max_depth=None), **params, random_state=69, n_jobs=n_jobs)
+    if name == "Random Forest":
+        return RandomForestClassifier(**params, random_state=69, n_jobs=n_jobs)
+    if name == "Boosting":
+        return GradientBoostingClassifier(**params, random_state=69)
+    if name == "Hist Boosting":
+        params = dict(params)
+        return SharedBinsHistGradientBoosting(max_iter=params.pop("n_estimators", 100), **params, early_stopping=False,
+                                              random_state=69)
+    raise ValueError(f"Unknown classifier {name!r}")
+
+def estimator_count(model):
+    """Trees (or boosting stages) a fitted ensemble actually has, early stopping can leave fewer than asked for."""
+    if isinstance(model, HistGradientBoostingClassifier):
+        return model.n_iter_
+    return model.n_estimators
+
+def _set_estimator_count(model, count):
+    model.set_params(**{"max_iter" if isinstance(model, HistGradientBoostingClassifier) else "n_estimators": count})
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far in MB, None where there is no resource module (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KB on Linux
+
+def split_jobs(n_jobs, num_tasks):
+    """Split n_jobs cores into (pool workers, n_jobs per bagging/RF fit).
+
+    Candidates are independent, so as many as possible run side by side and only the cores left over
+    go to sklearn's own n_jobs inside each fit.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    workers = max(1, min(n_jobs, num_tasks))
+    return workers, max(1, n_jobs // workers)
+
+def fast_predict(model, X):
+    """model.predict(X). For a PackedBits X, trees and forests that predict on one thread walk their
+    CompiledForest over the bits. Forests with n_jobs != 1 predict their trees in parallel threads, and
+    the CompiledForest walk is single-threaded, so they unpack the bits and go through sklearn instead
+    (ensemble_benchmark.py times both)."""
+    if isinstance(X, PackedBits):
+        if is_compilable(model) and effective_n_jobs(model.get_params().get("n_jobs")) == 1:
+            return compiled_forest(model).predict(X)
+        X = X.to_dense()
+    return model.predict(X)
+
+def validation_f1(y_valid, y_pred, multiclass=False):
+    if multiclass:
+        return f1_score(y_valid, y_pred, average='weighted')  # Use F1-score as selection criteria
+    return f1_score(y_valid, y_pred)
+
+# Per-process datasets for the search workers: {key: (X_train, y_train, X_valid, y_valid)}
+_search_data = OrderedDict()
+_search_data_dir = None
+_SEARCH_DATA_CACHE_SIZE = 3 # tasks are grouped by dataset, so a worker only needs the last few
+
+# Per-process binned training data for hist boosting: {key: (BinnedData, binned validation rows)}
+_search_bins = OrderedDict()
+
+def _init_search_worker(data_dir=None, in_memory=None):
+    global _search_data_dir
+    _search_data_dir = data_dir
+    _search_data.clear()
+    _search_bins.clear()
+    if in_memory is not None:
+        _search_data[None] = in_memory
+
+def _get_search_data(key):
+    if key not in _search_data:
+        c, d = key
+        X_train, y_train, X_valid, y_valid, _, _ = load_dataset(c, d, _search_data_dir,
+                                                                 dataset_cache_dir(_search_data_dir))
+        # trees fit on float32 internally, converting once here saves a copy on every fit
+        # validation rows are only ever predicted, so they stay bit-packed (32x smaller than float32)
+        _search_data[key] = (np.asarray(X_train, dtype=np.float32), np.asarray(y_train, dtype=np.int64),
+                             pack_if_binary(X_valid), np.asarray(y_valid, dtype=np.int64))
+        while len(_search_data) > _SEARCH_DATA_CACHE_SIZE:
+            _search_data.popitem(last=False)
+    _search_data.move_to_end(key)
+    return _search_data[key]
+
+def _get_search_bins(key):
+    """The dataset's training rows binned once for every hist boosting candidate in this process."""
+    if key not in _search_bins:
+        X_train, _, X_valid, _ = _get_search_data(key)
+        binned = BinnedData(X_train)
+        _search_bins[key] = (binned, binned.transform(X_valid.to_dense() if isinstance(X_valid, PackedBits) else X_valid))
+        while len(_search_bins) > _SEARCH_DATA_CACHE_SIZE:
+            _search_bins.popitem(last=False)
+    _search_bins.move_to_end(key)
+    return _search_bins[key]
+
+def _fit_search_model(model, key, rows=None, early_stopping=True):
+    """Fit a candidate on the dataset's training rows (or a subset of them).
+
+    Hist boosting fits from the shared bins and, with early_stopping, stops once the validation loss
+    hasn't improved for n_iter_no_change iterations.
+    """
+    X_train, y_train, X_valid, y_valid = _get_search_data(key)
+    if not isinstance(model, SharedBinsHistGradientBoosting):
+        return model.fit(X_train if rows is None else X_train[rows], y_train if rows is None else y_train[rows])
+    model.set_params(early_stopping=early_stopping)
+    if not shared_bins_supported(): # sklearn internals changed, bin the raw rows on every fit instead
+        X_rows, y_rows = (X_train, y_train) if rows is None else (X_train[rows], y_train[rows])
+        if not early_stopping:
+            return model.fit(X_rows, y_rows)
+        return model.fit(X_rows, y_rows, X_val=X_valid.to_dense() if isinstance(X_valid, PackedBits) else X_valid,
+                         y_val=y_valid)
+    binned, valid_codes = _get_search_bins(key)
+    return model.fit_binned(binned, y_train if rows is None else y_train[rows], rows,
+                            valid_codes if early_stopping else None, y_valid)
+
+def staged_predictions(model, X, counts):
+    """Predictions of a fitted ensemble as if it only had its first k estimators, for every k in counts.
+
+    Boosting uses staged_predict, and counts past an early stop get the final stage's predictions. Forests and bagging add up the per-tree class probabilities once,
+    in order, and take the argmax at each count, which is what predict() does with k trees. For
+    PackedBits X that sum runs on the model's CompiledForest, which is faster than the per-tree loop below
+    at any thread count.
+    """
+    counts = sorted(counts)
+    if isinstance(X, PackedBits):
+        if is_compilable(model):
+            return compiled_forest(model).staged_predict(X, counts)
+        X = X.to_dense()
+    predictions = {}
+    if isinstance(model, (GradientBoostingClassifier, HistGradientBoostingClassifier)):
+        for stage, y_pred in enumerate(model.staged_predict(X), start=1):
+            if stage in counts:
+                predictions[stage] = y_pred
+        for count in counts:
+            predictions.setdefault(count, y_pred) # stopped early, more stages would be the same model
+        return predictions
+
+    X = np.asarray(X, dtype=np.float32)
+    proba = np.zeros((X.shape[0], len(model.classes_)))
+    for k, estimator in enumerate(model.estimators_, start=1):
+        if isinstance(model, BaggingClassifier):
+            # bagged trees may have seen only some of the classes and only some of the features
+            proba[:, estimator.classes_.astype(int)] += estimator.predict_proba(X[:, model.estimators_features_[k - 1]])
         else:
-            f1 = f1_score(y_valid, y_pred)
-
-        if f1 > best_f1:
-            best_f1 = f1
-            best_model = model
-            best_params = {
-                "n_estimators": n_estimators,
-                "learning_rate": learning_rate,
-                "max_depth": max_depth,
-
-            }
-
-    return best_model, best_params
-
-
-def train_decision_tree(X_train, y_train, X_valid, y_valid, multiclass=False):
-
-    parameter_grid = {
-        "criterion" : ["entropy"],
-        "splitter": ["best"],
-        "max_depth": [10, 25],
-    }
-
-    if not multiclass:
-        parameter_grid = {
-        "criterion": ["entropy", "gini"],
-        "splitter": ["best", "random"],
-        "max_depth": [None, 10, 25, 50],
-                                  }
-
-
-    best_model = None
-    best_params = None
-    best_f1 = 0
-    for criterion, splitter, max_depth in product(parameter_grid["criterion"],
-                                                  parameter_grid["splitter"],
-                                                  parameter_grid["max_depth"]):
-        model = DecisionTreeClassifier(criterion=criterion, splitter=splitter, max_depth=max_depth, random_state=69)
-        model.fit(X_train, y_train)  # Train only on training set
-        y_pred = model.predict(X_valid)  # Evaluate on validation set
-
-        if multiclass:
-            f1 = f1_score(y_valid, y_pred, average='weighted')  # Use F1-score as selection criteria
+            proba += estimator.predict_proba(X)
+        if k in counts:
+            predictions[k] = model.classes_[np.argmax(proba, axis=1)]
+    return predictions
+
+def truncate_ensemble(model, n_estimators):
+    """Copy of a fitted forest or bagging model cut down to its first n_estimators trees.
+
+    The trees' seeds are drawn in order from random_state, so this matches fitting n_estimators from scratch.
+    """
+    model = copy.copy(model)
+    model.estimators_ = model.estimators_[:n_estimators]
+    if isinstance(model, BaggingClassifier):
+        model.estimators_features_ = model.estimators_features_[:n_estimators]
+        model._seeds = model._seeds[:n_estimators]
+    model.n_estimators = n_estimators
+    return model
+
+def _grid_tasks(key, name, multiclass):
+    """One task per config, where all the n_estimators values of a config share a single fit.
+
+    Each task carries [(grid index, n_estimators)] so results can still be ordered like the full grid.
+    """
+    grid = PARAMETER_GRIDS[name][multiclass]
+    if "n_estimators" not in grid:
+        return [(key, name, params, multiclass, [(index, None)])
+                for index, params in enumerate(parameter_candidates(name, multiclass))]
+    tasks = {}
+    for index, params in enumerate(parameter_candidates(name, multiclass)):
+        config = {k: v for k, v in params.items() if k != "n_estimators"}
+        config_key = tuple(config.items())
+        if config_key not in tasks:
+            tasks[config_key] = (key, name, config, multiclass, [])
+        tasks[config_key][4].append((index, params["n_estimators"]))
+    return list(tasks.values())
+
+def _fit_candidate(task):
+    key, name, config, multiclass, counts, inner_jobs = task
+    _, _, X_valid, y_valid = _get_search_data(key)
+    largest = max(count for _, count in counts) if counts[0][1] is not None else None
+    params = dict(config) if largest is None else {"n_estimators": largest, **config}
+    model = make_model(name, params, inner_jobs)
+    start = time.perf_counter()
+    with threadpool_limits(limits=inner_jobs, user_api="openmp"): # hist boosting threads, not a pool's worth each
+        _fit_search_model(model, key) # Train using only training data, once at the largest estimator count
+    fit_seconds = time.perf_counter() - start
+    if largest is None:
+        y_pred = fast_predict(model, X_valid) # Evaluate on the validation data by getting predicted value
+        return [(key, name, counts[0][0], params, validation_f1(y_valid, y_pred, multiclass),
+                 time.perf_counter() - start, model, peak_rss_mb())]
+
+    results = []
+    start = time.perf_counter()
+    with threadpool_limits(limits=inner_jobs, user_api="openmp"):
+        staged = staged_predictions(model, X_valid, [count for _, count in counts])
+    score_seconds = time.perf_counter() - start
+    for index, count in counts:
+        # smaller counts cost no fitting, so only the largest count is charged for the fit
+        seconds = score_seconds / len(counts) + (fit_seconds if count == largest else 0.0)
+        results.append((key, name, index, {"n_estimators": min(count, estimator_count(model)), **config},
+                        validation_f1(y_valid, staged[count], multiclass), seconds, model, peak_rss_mb()))
+    return results
+
+def _refit_winner(task):
+    """Refit a boosting winner at its winning stage count, in the search pool like the candidates were."""
+    job, params, inner_jobs = task
+    key, name = job
+    model = make_model(name, params, inner_jobs)
+    with threadpool_limits(limits=inner_jobs, user_api="openmp"):
+        _fit_search_model(model, key, early_stopping=False)
+    return job, model, params
+
+def _run_tasks(work, workers, data_dir, in_memory, record, complete):
+    """Run (function, task) pairs on a pool of workers (or in this process for one worker) until none are left.
+
+    _refit_winner results go to complete(job, model, params), every other result to record(result),
+    which returns the follow-up (function, task) pairs it unlocks.
+    """
+    if workers == 1:
+        while work:
+            (fn, task), work = work[0], work[1:]
+            if fn is _refit_winner:
+                complete(*fn(task))
+            else:
+                work = work + record(fn(task))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                             initargs=(data_dir, in_memory)) as pool:
+        running = {pool.submit(fn, task): fn for fn, task in work}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                if running.pop(future) is _refit_winner:
+                    complete(*future.result())
+                else:
+                    running.update((pool.submit(fn, task), fn) for fn, task in record(future.result()))
+
+def _expected_cost(task):
+    key, name, _, _, counts = task[:5]
+    size = 1 if key is None else key[0] * key[1] # clauses x examples
+    return size * max(count or 1 for _, count in counts)
+
+def _run_candidates(tasks, n_jobs, data_dir=None, in_memory=None, on_job_done=None):
+    """Fit every task from _grid_tasks and keep the best model per (dataset, classifier).
+
+    Returns {(key, name): (best_model, best_params, timings)} where timings lists
+    {"params", "f1", "seconds"} for every candidate in grid order. Ties go to the earlier candidate,
+    like the original serial loops. on_job_done(job, result) is called as soon as a job's last
+    candidate finishes, while the rest of the sweep keeps running.
+    """
+    workers, inner_jobs = split_jobs(n_jobs, len(tasks))
+    tasks = [task[:5] + (inner_jobs,) for task in tasks]
+    # biggest datasets and most estimators first so the pool doesn't finish on one long fit,
+    # keeping each dataset's tasks together so workers can reuse the dataset they already loaded
+    dataset_cost = {}
+    for task in tasks:
+        dataset_cost[task[0]] = max(dataset_cost.get(task[0], 0), _expected_cost(task))
+    tasks.sort(key=lambda task: (-dataset_cost[task[0]], str(task[0]), -_expected_cost(task)))
+
+    pending = {}
+    for task in tasks:
+        pending[(task[0], task[1])] = pending.get((task[0], task[1]), 0) + 1
+    best = {}
+    timings = {}
+    results = {}
+    _init_search_worker(data_dir, in_memory) # one worker fits in this process
+
+    def finish(job):
+        """Complete the job, or return the refit of its boosting winner when that has to come first."""
+        _, _, model, params = best.pop(job)
+        if "n_estimators" in params and estimator_count(model) != params["n_estimators"]:
+            if isinstance(model, (GradientBoostingClassifier, HistGradientBoostingClassifier)):
+                return [(_refit_winner, (job, params, inner_jobs))] # refit the winning stage count
+            model = truncate_ensemble(model, params["n_estimators"])
+        complete(job, model, params)
+        return []
+
+    def complete(job, model, params):
+        results[job] = (model, params, [timing for _, timing in sorted(timings.pop(job), key=lambda t: t[0])])
+        if on_job_done is not None:
+            on_job_done(job, results[job])
+
+    def record(task_results):
+        for key, name, index, params, f1, seconds, model, rss in task_results:
+            timings.setdefault((key, name), []).append((index, {"params": params, "f1": f1, "seconds": seconds,
+                                                                "peak_rss_mb": rss}))
+            current = best.get((key, name))
+            if current is None or f1 > current[0] or (f1 == current[0] and index < current[1]):
+                best[(key, name)] = (f1, index, model, params) # only the best fitted model is kept
+        job = (task_results[0][0], task_results[0][1])
+        pending[job] -= 1
+        return finish(job) if pending[job] == 0 else []
+
+    _run_tasks([(_fit_candidate, task) for task in tasks], workers, data_dir, in_memory, record, complete)
+    _search_data.clear()
+    return results
+
+def _halving_plan(name, multiclass, factor):
+    """Configs and rungs for successive halving.
+
+    Ensembles use their own n_estimators grid values as the rungs: every config starts at the smallest
+    count and survivors are grown with warm_start. Decision trees have no estimators, so their rungs are
+    training subsamples of 1/factor^k of the data. Returns (configs, rungs, uses_estimators).
+    """
+    grid = PARAMETER_GRIDS[name][multiclass]
+    if "n_estimators" in grid:
+        other = {key: values for key, values in grid.items() if key != "n_estimators"}
+        configs = [dict(zip(other.keys(), values)) for values in product(*other.values())]
+        return configs, sorted(grid["n_estimators"]), True
+    configs = parameter_candidates(name, multiclass)
+    num_rungs = max(1, int(np.ceil(np.log(len(configs)) / np.log(factor))))
+    return configs, [factor ** (k - num_rungs + 1) for k in range(num_rungs)], False
+
+def _fit_halving_task(task):
+    job, config_id, rung, params, multiclass, inner_jobs, model, resource, uses_estimators = task
+    key, name = job
+    _, y_train, X_valid, y_valid = _get_search_data(key)
+    start = time.perf_counter()
+    with threadpool_limits(limits=inner_jobs, user_api="openmp"):
+        if uses_estimators:
+            if model is None:
+                model = make_model(name, params, inner_jobs)
+                model.set_params(warm_start=True)
+            if isinstance(model, HistGradientBoostingClassifier) and hasattr(model, "n_iter_") \
+                    and model.n_iter_ < model.max_iter:
+                pass # stopped early on an earlier rung, a bigger max_iter would stop in the same place
+            else:
+                _set_estimator_count(model, resource)
+                if "n_jobs" in model.get_params():
+                    model.set_params(n_jobs=inner_jobs)
+                _fit_search_model(model, key) # warm_start only fits the estimators added since the last rung
+        else:
+            # same shuffled subsample for every config so they're compared on equal footing
+            rows = np.random.default_rng(69).permutation(len(y_train))[:max(2, int(round(resource * len(y_train))))]
+            model = make_model(name, params, inner_jobs)
+            _fit_search_model(model, key, rows)
+        f1 = validation_f1(y_valid, fast_predict(model, X_valid), multiclass)
+    return job, config_id, rung, f1, time.perf_counter() - start, model, peak_rss_mb()
+
+def _run_halving(jobs, n_jobs, factor=3, data_dir=None, in_memory=None, on_job_done=None):
+    """Successive halving for every (key, name, multiclass) job, all sharing one process pool.
+
+    Each rung fits the surviving configs on a bigger resource, then only the top 1/factor (at least one)
+    move on. Returns the same {(key, name): (best_model, best_params, timings)} as _run_candidates,
+    and calls on_job_done(job, result) as soon as a job's last rung is done.
+    """
+    state = {}
+    for key, name, multiclass in jobs:
+        configs, rungs, uses_estimators = _halving_plan(name, multiclass, factor)
+        state[(key, name)] = {"multiclass": multiclass, "configs": configs, "rungs": rungs,
+                              "uses_estimators": uses_estimators, "rung": 0, "alive": list(range(len(configs))),
+                              "models": {}, "scores": {}, "pending": 0, "timings": []}
+    workers, inner_jobs = split_jobs(n_jobs, sum(len(job["configs"]) for job in state.values()))
+    results = {}
+    timings = {}
+    _init_search_worker(data_dir, in_memory) # one worker fits in this process
+
+    def rung_tasks(job):
+        job_state = state[job]
+        rung = job_state["rung"]
+        resource = job_state["rungs"][rung]
+        job_state["pending"] = len(job_state["alive"])
+        return [(_fit_halving_task, (job, config_id, rung, job_state["configs"][config_id], job_state["multiclass"],
+                                     inner_jobs, job_state["models"].get(config_id), resource,
+                                     job_state["uses_estimators"]))
+                for config_id in job_state["alive"]]
+
+    def finish(job):
+        """Complete the job, or return the refit of its winner when that has to come first."""
+        job_state = state.pop(job)
+        last_rung = len(job_state["rungs"]) - 1
+        if job_state["uses_estimators"]:
+            candidates = job_state["scores"].items() # every rung is a real grid point trained on all the data
         else:
-            f1 = f1_score(y_valid, y_pred)
+            candidates = [(rc, score) for rc, score in job_state["scores"].items() if rc[0] == last_rung]
+        (rung, config_id), (f1, _, params) = min(candidates, key=lambda item: (-item[1][0], item[1][1]))
+        model = job_state["models"].get(config_id)
+        timings[job] = job_state["timings"]
+        if model is None or (job_state["uses_estimators"] and rung != last_rung):
+            # the winner's model has since been grown (or pruned), refit it at the winning size
+            return [(_refit_winner, (job, params, inner_jobs))]
+        if "warm_start" in model.get_params():
+            model.set_params(warm_start=False) # so a later refit on train+valid starts from scratch
+        complete(job, model, params)
+        return []
+
+    def complete(job, model, params):
+        results[job] = (model, params, timings.pop(job))
+        if on_job_done is not None:
+            on_job_done(job, results[job])
+
+    def record(result):
+        """Store a finished fit, returning the next rung's tasks (or the winner's refit) once the job's
+        current rung is done."""
+        job, config_id, rung, f1, seconds, model, rss = result
+        job_state = state[job]
+        resource = job_state["rungs"][rung]
+        params = dict(job_state["configs"][config_id])
+        if job_state["uses_estimators"]:
+            params = {"n_estimators": min(resource, estimator_count(model)), **params} # first key in these grids
+            grid_index = rung * len(job_state["configs"]) + config_id # position in the full grid for ties
+        else:
+            grid_index = config_id
+        job_state["models"][config_id] = model
+        job_state["scores"][(rung, config_id)] = (f1, grid_index, params)
+        job_state["timings"].append({"params": params, "f1": f1, "seconds": seconds, "resource": resource,
+                                     "peak_rss_mb": rss})
+        job_state["pending"] -= 1
+        if job_state["pending"]:
+            return []
+        if rung == len(job_state["rungs"]) - 1:
+            return finish(job)
+        ranked = sorted(job_state["alive"], key=lambda c: (-job_state["scores"][(rung, c)][0], c))
+        job_state["alive"] = ranked[:max(1, int(np.ceil(len(ranked) / factor)))]
+        for config_id in set(job_state["models"]) - set(job_state["alive"]):
+            del job_state["models"][config_id] # pruned, free the fitted model
+        job_state["rung"] += 1
+        return rung_tasks(job)
+
+    _run_tasks([task for job in state for task in rung_tasks(job)], workers, data_dir, in_memory, record, complete)
+    _search_data.clear()
+    return results
+
+def grid_search(name, X_train, y_train, X_valid, y_valid, multiclass=False, n_jobs=-1, search="grid", factor=3):
+    """Fit every candidate in the classifier's grid in a process pool and pick the best by validation F1.
+
+    search="halving" uses successive halving instead of fitting the whole grid (see _run_halving).
+    Returns (best_model, best_params, timings) with per-candidate F1 and fit time.
+    """
+    in_memory = (np.asarray(X_train, dtype=np.float32), np.asarray(y_train),
+                 np.asarray(X_valid, dtype=np.float32), np.asarray(y_valid))
+    if search == "halving":
+        return _run_halving([(None, name, multiclass)], n_jobs, factor, in_memory=in_memory)[(None, name)]
+    return _run_candidates(_grid_tasks(None, name, multiclass), n_jobs, in_memory=in_memory)[(None, name)]
+
+def train_valid_matrix(X_train, X_valid):
+    """Train and validation rows stacked into one contiguous float32 array, written in place without
+    the intermediate copies pd.concat / np.concatenate + astype would make."""
+    X_train, X_valid = np.asarray(X_train), np.asarray(X_valid)
+    X_train_valid = np.empty((X_train.shape[0] + X_valid.shape[0], X_train.shape[1]), dtype=np.float32)
+    X_train_valid[:X_train.shape[0]] = X_train
+    X_train_valid[X_train.shape[0]:] = X_valid
+    return X_train_valid
+
+def final_fit(name, params, X_train_valid, y_train_valid, X_test, y_test, multiclass=False, n_jobs=-1):
+    """Fit the chosen params on train + validation and score on test. Returns (model, accuracy, f1, seconds)."""
+    start = time.perf_counter()
+    model = make_model(name, params, n_jobs)
+    with threadpool_limits(limits=n_jobs if n_jobs > 0 else None, user_api="openmp"):
+        model.fit(X_train_valid, y_train_valid) # Train model again with training and validation data combined
+    y_pred = fast_predict(model, X_test)
+    f1 = f1_score(y_test, y_pred, average='weighted') if multiclass else f1_score(y_test, y_pred)
+    return model, accuracy_score(y_test, y_pred), f1, time.perf_counter() - start
+
+# Per-process train+valid/test matrices for the final fits: {(clauses, examples): (...)}
+_final_data = OrderedDict()
+
+def _get_final_data(key, data_dir):
+    if key not in _final_data:
+        X_train, y_train, X_valid, y_valid, X_test, y_test = load_dataset(key[0], key[1], data_dir,
+                                                                          dataset_cache_dir(data_dir))
+        _final_data[key] = (train_valid_matrix(X_train, X_valid), np.concatenate([y_train, y_valid]).astype(np.int64),
+                            pack_if_binary(X_test), np.asarray(y_test, dtype=np.int64))
+        while len(_final_data) > _SEARCH_DATA_CACHE_SIZE:
+            _final_data.popitem(last=False)
+    _final_data.move_to_end(key)
+    return _final_data[key]
+
+def _dataset_fingerprint(key, data_dir):
+    """Content hashes of a dataset's files, so edited files aren't served stale results. Also converts
+    the CSVs into the dataset cache before any worker needs them."""
+    c, d = key
+    return tuple(cached_split(os.path.join(data_dir, f"{split}_c{c}_d{d}.csv"), dataset_cache_dir(data_dir))[2]
+                 for split in ("train", "valid", "test"))
+
+def dataset_hash(fingerprint):
+    """One hex digest for a dataset's (train, valid, test) content hashes."""
+    return hashlib.sha256("".join(fingerprint).encode("utf-8")).hexdigest()
+
+def _cache_path(cache_dir, kind, *parts):
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:24]
+    return os.path.join(cache_dir, f"{kind}_{digest}.pkl")
+
+def _load_cached(path):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def _save_cached(path, value):
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(value, f)
+    os.replace(path + ".tmp", path) # never leave a half-written pickle behind
+
+def _final_fit_task(args):
+    key, name, params, data_dir, cache_path = args
+    X_train_valid, y_train_valid, X_test, y_test = _get_final_data(key, data_dir)
+    model, accuracy, f1, seconds = final_fit(name, params, X_train_valid, y_train_valid, X_test, y_test, n_jobs=1)
+    _save_cached(cache_path, (model, accuracy, f1, seconds, peak_rss_mb()))
+    return model, accuracy, f1, seconds, peak_rss_mb()
+
+def run_sweep(classifier_names, clause_counts, example_sizes, data_dir, n_jobs=-1, search="grid", factor=3,
+              cache_dir=None, skip=(), on_result=None):
+    """Search every (classifier, clauses, examples) job on one process pool, then refit each winner on
+    train + validation and score it on test.
+
+    Workers load the clause datasets themselves, so no data is pickled between processes. Each job's
+    final fit is handed to a second pool as soon as its search finishes, so it overlaps with the rest of
+    the sweep. The n_jobs cores are split between the two pools, a quarter for final fits and the rest
+    for the search, and with a single core final fits run in this process instead. With a cache_dir,
+    search results and final models are cached by (dataset, params) and a rerun only does the work that
+    is missing. Jobs in skip are left out, and on_result(name, clauses, examples, result) is called on
+    this thread for every scored final fit, checked for as each search job finishes and once at the end.
+    Whatever on_result raises stops the sweep.
+
+    Returns {(name, clauses, examples): {"params", "timings", "model", "accuracy", "f1", "final_seconds",
+    "peak_rss_mb", "dataset_hash"}}, where peak_rss_mb is the largest worker peak seen by the job.
+    """
+    jobs = [((c, d), name) for name in classifier_names for c in clause_counts for d in example_sizes
+            if (name, c, d) not in skip]
+    fingerprints = {key: _dataset_fingerprint(key, data_dir) for key, _ in jobs}
+    grid_paths = {}
+    for key, name in jobs:
+        grid_paths[(key, name)] = None if cache_dir is None else _cache_path(
+            cache_dir, "search", key, fingerprints[key], name, search, factor, PARAMETER_GRIDS[name][False])
+
+    sweep = {}
+    total_cores = n_jobs if n_jobs is not None and n_jobs >= 1 else os.cpu_count() or 1
+    final_workers = max(1, total_cores // 4) if total_cores > 1 else 0 # one core budget for both pools
+    search_jobs = total_cores - final_workers
+
+    def finished(job, final):
+        (c, d), name = job
+        model, accuracy, f1, seconds = final[:4]
+        rss = [t.get("peak_rss_mb") for t in sweep[job]["timings"]] + [final[4] if len(final) > 4 else None]
+        rss = [value for value in rss if value is not None]
+        sweep[job].update(model=model, accuracy=accuracy, f1=f1, final_seconds=seconds,
+                          peak_rss_mb=max(rss) if rss else None, dataset_hash=dataset_hash(fingerprints[(c, d)]))
+        if on_result is not None:
+            on_result(name, c, d, sweep[job])
+
+    with ProcessPoolExecutor(max_workers=final_workers) if final_workers else nullcontext() as final_pool:
+        final_futures = {}
+
+        def collect():
+            # on_result runs here on the main thread, a done callback would swallow what it (or the store) raises
+            for future in [future for future in final_futures if future.done() and future.exception() is None]:
+                finished(final_futures.pop(future), future.result())
+
+        def on_job_done(job, result):
+            key, name = job
+            _, params, timings = result
+            _save_cached(grid_paths[job], (params, timings))
+            sweep[job] = {"params": params, "timings": timings}
+            final_path = None if cache_dir is None else _cache_path(
+                cache_dir, "final", key, fingerprints[key], name, sorted(params.items()))
+            cached = _load_cached(final_path)
+            if cached is not None:
+                finished(job, cached)
+            elif final_pool is None:
+                finished(job, _final_fit_task((key, name, params, data_dir, final_path)))
+            else:
+                final_futures[final_pool.submit(_final_fit_task, (key, name, params, data_dir, final_path))] = job
+            collect() # records the final fits scored since the last job, failures are raised after the sweep
+
+        remaining = []
+        for job in jobs:
+            cached = _load_cached(grid_paths[job])
+            if cached is not None:
+                on_job_done(job, (None, cached[0], cached[1])) # search already done on an earlier run
+            else:
+                remaining.append(job)
+
+        if search == "halving":
+            _run_halving([(key, name, False) for key, name in remaining], search_jobs, factor, data_dir=data_dir,
+                         on_job_done=on_job_done)
+        elif remaining:
+            tasks = [task for key, name in remaining for task in _grid_tasks(key, name, False)]
+            _run_candidates(tasks, search_jobs, data_dir=data_dir, on_job_done=on_job_done)
+
+        for future in as_completed(list(final_futures)):
+            if future.exception() is None:
+                finished(final_futures.pop(future), future.result())
+        for future in final_futures:
+            future.result() # a final fit failed, raise it now that every other job is recorded
+    return {(name, c, d): result for ((c, d), name), result in sweep.items()}
+
+def train_bagging_classifier(X_train, y_train, X_valid, y_valid, multiclass=False, n_jobs=-1, search="grid"):
+    best_model, best_params, _ = grid_search("Bagging", X_train, y_train, X_valid, y_valid, multiclass, n_jobs, search)
+    return best_model, best_params
 
+def train_random_forest(X_train, y_train, X_valid, y_valid, multiclass=False, n_jobs=-1, search="grid"):
+    best_model, best_params, _ = grid_search("Random Forest", X_train, y_train, X_valid, y_valid, multiclass, n_jobs, search)
+    return best_model, best_params
 
-        if f1 > best_f1:  # If better, update the best model
-            best_f1 = f1
-            best_model = model
-            best_params = {"criterion": criterion, "splitter": splitter, "max_depth": max_depth}
+def train_boosting_classifier(X_train, y_train, X_valid, y_valid, multiclass=False, n_jobs=-1, search="grid"):
+    best_model, best_params, _ = grid_search("Boosting", X_train, y_train, X_valid, y_valid, multiclass, n_jobs, search)
+    return best_model, best_params
 
+def train_decision_tree(X_train, y_train, X_valid, y_valid, multiclass=False, n_jobs=-1, search="grid"):
+    best_model, best_params, _ = grid_search("Decision Tree", X_train, y_train, X_valid, y_valid, multiclass, n_jobs, search)
     return best_model, best_params
 
 def evaluate_accuracy(model, X_test, y_test):
@@ -222,40 +803,49 @@ def evaluate_accuracy(model, X_test, y_test):
     return accuracy
 
 def mnist_train_boosting_classifier(X_train, y_train):
-    from sklearn.model_selection import GridSearchCV
     parameter_grid = {
         "max_iter": [100],
         "learning_rate": [0.1],
         "max_depth": [3,5]
     }
 
-    #speed up
-    from sklearn.ensemble import HistGradientBoostingClassifier
-    model = HistGradientBoostingClassifier(n_iter_no_change=5, random_state=69)
-
-    grid_search = GridSearchCV(model, parameter_grid, scoring="f1_weighted", cv=2, n_jobs=-1)
-    grid_search.fit(X_train, y_train)
-
-    best_model = grid_search.best_estimator_
-    best_params = grid_search.best_params_
+    #speed up: bin the pixels once for every candidate and fold instead of once per fit
+    binned = BinnedData(X_train) if shared_bins_supported() else None
+    folds = list(StratifiedKFold(n_splits=2).split(X_train, y_train)) # same folds GridSearchCV(cv=2) used
+
+    def fit_early_stopped(params, rows):
+        # early stopping watches 10% of the fit's own rows, never the rows it's scored on
+        fit_rows, stop_rows = train_test_split(rows, test_size=0.1, stratify=y_train[rows], random_state=69)
+        model = SharedBinsHistGradientBoosting(**params, early_stopping=True, n_iter_no_change=5, random_state=69)
+        if binned is None:
+            return model.fit(X_train[fit_rows], y_train[fit_rows], X_val=X_train[stop_rows], y_val=y_train[stop_rows])
+        return model.fit_binned(binned, y_train[fit_rows], fit_rows, np.ascontiguousarray(binned.codes[stop_rows]),
+                                y_train[stop_rows])
+
+    best_score, best_params = -1, None
+    for values in product(*parameter_grid.values()):
+        params = dict(zip(parameter_grid.keys(), values))
+        scores = []
+        for train_rows, test_rows in folds:
+            model = fit_early_stopped(params, train_rows)
+            scores.append(f1_score(y_train[test_rows], model.predict(X_train[test_rows]), average="weighted"))
+        if np.mean(scores) > best_score:
+            best_score, best_params = np.mean(scores), params
+
+    # refit on all of the training data, early stopped the same way as in the folds
+    best_model = fit_early_stopped(best_params, np.arange(len(y_train)))
 
     return best_model, best_params
 
 
 def mnist():
-    #Load MNIST dataset
-    X, y = fetch_openml('mnist_784', version=1, return_X_y=True)
-    X = X / 255.0
-
+    #Load MNIST dataset, memory-mapped uint8 from the local store after the first run
+    X, y = load_mnist()
 
-    X_train, X_test = X[:60000], X[60000:]
+    # scaled to [0, 1] straight into float32, a chunk at a time
+    X_train, X_test = scaled(X, np.arange(60000)), scaled(X, np.arange(60000, len(X)))
     y_train, y_test = y[:60000], y[60000:]
 
-
-    #Classifier was trained on numpy array that does not have feature names, unlike pd
-    X_train = X_train.to_numpy()
-    X_test = X_test.to_numpy()
-
     classifiers = {
         "Decision Tree": train_decision_tree,
         "Bagging": train_bagging_classifier,
@@ -263,6 +853,11 @@ def mnist():
         "Boosting": train_boosting_classifier # not really
     }
 
+    # Split once, the split used to reassign X_train inside the loop so every classifier got less data
+    X_fit, X_valid, y_fit, y_valid = train_test_split(X_train, y_train, test_size=.30, random_state=45)
+    X_train_valid = train_valid_matrix(X_fit, X_valid) # built once and shared by every final fit
+    y_train_valid = np.concatenate([y_fit, y_valid])
+
     for name, train_func in classifiers.items():
         print(f"\n{name.upper()}")
 
@@ -272,12 +867,11 @@ def mnist():
             best_model, best_params = mnist_train_boosting_classifier(X_train, y_train) #cross validation
 
         else:
-            X_train, X_valid, y_train, y_valid = train_test_split(X_train, y_train, test_size=.30, random_state=45)
-            best_model, best_params = train_func(X_train, y_train, X_valid, y_valid, multiclass=True)
+            best_model, best_params = train_func(X_fit, y_fit, X_valid, y_valid, multiclass=True)
 
             # Retrain on full training + validation data
-            X_train_valid = np.concatenate([X_train, X_valid])
-            y_train_valid = np.concatenate([y_train, y_valid])
+            if "n_jobs" in best_model.get_params():
+                best_model.set_params(n_jobs=-1)
             best_model.fit(X_train_valid, y_train_valid)
 
         # Evaluate on test set
@@ -286,34 +880,58 @@ def mnist():
 
 
 
-def main():
-    clause_counts = [300, 500, 1000, 1500, 1800]
-    example_sizes = [100, 1000, 5000]
-
-    path = input("Enter the pathname for the files using \\\\ instead of :")
-
-
-    classifiers = {
-            "Decision Tree": train_decision_tree,
-            "Bagging": train_bagging_classifier,
-            "Random Forest": train_random_forest,
-            "Boosting": train_boosting_classifier
-    }
-    for name, train_func in classifiers.items():
-         for c in clause_counts:
-            for d in example_sizes:
-                X_train, y_train, X_valid, y_valid, X_test, y_test = load_dataset(c, d, path)
-                best_model, best_params = train_func(X_train, y_train, X_valid, y_valid)
-                X_train_valid = pd.concat([X_train, X_valid])
-                y_train_valid = pd.concat([y_train, y_valid])
-                best_model.fit(X_train_valid, y_train_valid) # Train model again with training and validation data combined
-
-                accuracy, f1 = evaluate_model(best_model, X_test, y_test)
-
-                print(f"\n{name.upper()}")
-                print(f"Clauses: {c}, Examples: {d}")
-                print(f"Best Parameters: {best_params}")
-                print(f"Test Accuracy {accuracy: .4f}, Test F1-Score: {f1:.4f}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the clause dataset sweep as one checkpointed job per "
+                                                 "(classifier, clauses, examples).")
+    parser.add_argument("data_dir", help="folder with the train/valid/test_c*_d*.csv files")
+    parser.add_argument("--classifiers", nargs="+", choices=["Decision Tree", "Bagging", "Random Forest", "Boosting"],
+                        default=["Decision Tree", "Bagging", "Random Forest", "Boosting"])
+    parser.add_argument("--clauses", nargs="+", type=int, default=[300, 500, 1000, 1500, 1800])
+    parser.add_argument("--examples", nargs="+", type=int, default=[100, 1000, 5000])
+    parser.add_argument("--search", choices=["grid", "halving"], default="grid")
+    parser.add_argument("--boosting", choices=["exact", "hist"], default="exact",
+                        help="hist uses HistGradientBoostingClassifier with shared bins and early stopping")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--store", help="SQLite result store, ensemble_results.sqlite in data_dir by default")
+    parser.add_argument("--rerun", action="store_true", help="run jobs the store already has results for")
+    parser.add_argument("--mnist", action="store_true", help="also run the MNIST experiment")
+    args = parser.parse_args(argv)
+
+    classifier_names = ["Hist Boosting" if name == "Boosting" and args.boosting == "hist" else name
+                        for name in args.classifiers]
+    store = ResultStore(args.store or os.path.join(args.data_dir, "ensemble_results.sqlite"))
+
+    # a job is done if the store has it for this search mode and these exact dataset files
+    done = set() if args.rerun else store.completed(args.search)
+    skip = set()
+    for c in args.clauses:
+        for d in args.examples:
+            digest = dataset_hash(_dataset_fingerprint((c, d), args.data_dir))
+            skip |= {(name, c, d) for name in classifier_names if (name, c, d, digest) in done}
+    if skip:
+        print(f"Skipping {len(skip)} jobs already in {store.path}")
+
+    def record(name, c, d, result):
+        store.record(name, c, d, args.search, result) # checkpoint, a crash later on doesn't lose this job
+        print(f"{name} c={c} d={d}: test F1 {result['f1']:.4f}, {len(result['timings'])} candidates, "
+              f"best {result['params']}")
+
+    # every job's search shares one process pool, final fits and test scores are cached next to the data
+    run_sweep(classifier_names, args.clauses, args.examples, args.data_dir, n_jobs=args.n_jobs, search=args.search,
+              cache_dir=os.path.join(args.data_dir, "ensemble_cache"), skip=skip, on_result=record)
+
+    results = pd.DataFrame([result for result in store.results(args.search)
+                            if result["classifier"] in classifier_names and result["clauses"] in args.clauses
+                            and result["examples"] in args.examples])
+    if results.empty:
+        print(f"No results in {store.path} for these jobs")
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200, "display.max_colwidth", 80):
+            print(results[["classifier", "clauses", "examples", "params", "accuracy", "f1", "search_seconds",
+                           "final_seconds", "peak_rss_mb"]].to_string(index=False))
+
+    if args.mnist:
+        mnist()
 
 # CODE FOR INDIVIDUAL TESTING:
 
@@ -381,8 +999,7 @@ def main():
             # print(f"Best Parameters: {best_params}")
             # print(f"Test Accuracy {accuracy: .4f}, Test F1-Score: {f1:.4f}")
             #
-main()
-mnist()
-
 
 
+if __name__ == "__main__": # keeps process pool workers from re-running the experiments on import
+    main()
@@ -0,0 +1,169 @@
+import weakref
+
+import numpy as np
+from sklearn.ensemble import BaggingClassifier, RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+
+class PackedBits:
+    """Boolean feature matrix stored 8 features to a byte, feature j in bit j % 8 of byte j // 8 of its row."""
+
+    def __init__(self, bits, n_features):
+        self.bits = np.ascontiguousarray(bits, dtype=np.uint8)
+        self.n_features = n_features
+
+    @classmethod
+    def from_dense(cls, X):
+        X = np.asarray(X)
+        if X.size and (X.min() < 0 or X.max() > 1 or not np.array_equal(X, X.astype(bool))):
+            raise ValueError("PackedBits only holds 0/1 features")
+        return cls(np.packbits(X.astype(bool), axis=1, bitorder="little"), X.shape[1])
+
+    @property
+    def shape(self):
+        return (self.bits.shape[0], self.n_features)
+
+    def __len__(self):
+        return self.bits.shape[0]
+
+    def __getitem__(self, rows):
+        return PackedBits(self.bits[rows], self.n_features)
+
+    def to_dense(self, dtype=np.float32):
+        return np.unpackbits(self.bits, axis=1, count=self.n_features, bitorder="little").astype(dtype, copy=False)
+
+
+def pack_if_binary(X):
+    """PackedBits for a 0/1 matrix, anything else is returned unchanged."""
+    try:
+        return PackedBits.from_dense(X)
+    except ValueError:
+        return X
+
+
+def is_compilable(model):
+    if isinstance(model, (DecisionTreeClassifier, RandomForestClassifier)):
+        return model.n_outputs_ == 1
+    if isinstance(model, BaggingClassifier):
+        return all(isinstance(tree, DecisionTreeClassifier) for tree in model.estimators_)
+    return False
+
+
+# fitted model -> (the trees it had when compiled, its CompiledForest)
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compiled_forest(model):
+    """CompiledForest(model), built on first use and reused until the model's trees change (a refit, or
+    warm_start growing it)."""
+    trees = (model.tree_,) if isinstance(model, DecisionTreeClassifier) else tuple(model.estimators_)
+    signature = (trees, getattr(model, "n_estimators", None)) # bagging divides by n_estimators
+    cached = _compiled.get(model)
+    if cached is None or len(cached[0][0]) != len(trees) or cached[0][1] != signature[1] \
+            or any(a is not b for a, b in zip(cached[0][0], trees)):
+        cached = (signature, CompiledForest(model))
+        _compiled[model] = cached
+    return cached[1]
+
+
+class CompiledForest:
+    """A fitted decision tree, random forest or bagged trees flattened into one set of node arrays.
+
+    Every tree's nodes are concatenated, so a batch walks all trees at once: each step reads the bit of
+    the node's feature for every (row, tree) pair and moves to children[2 * node + bit]. Leaves point to
+    themselves, so max_depth steps always lands every pair on its leaf. Probabilities are averaged in
+    tree order like sklearn's predict_proba, so predictions match model.predict.
+    """
+
+    def __init__(self, model):
+        if not is_compilable(model):
+            raise TypeError(f"Can't compile {type(model).__name__}, only single-output trees, forests and bagged trees")
+        self.classes_ = model.classes_
+        n_classes = len(model.classes_)
+        if isinstance(model, DecisionTreeClassifier):
+            trees, feature_maps, class_maps = [model], [None], [np.arange(n_classes)]
+            self.divisor = 1
+        else:
+            trees = model.estimators_
+            # ensemble trees are fit on class indices, and bagged trees may only have seen some classes
+            class_maps = [tree.classes_.astype(int) for tree in trees]
+            if isinstance(model, BaggingClassifier):
+                feature_maps = model.estimators_features_ # each bagged tree sees its own feature subset
+                self.divisor = model.n_estimators
+            else:
+                feature_maps = [None] * len(trees)
+                self.divisor = len(trees)
+
+        features, children, values, roots = [], [], [], []
+        offset = 0
+        self.max_depth = 0
+        for tree, feature_map, class_map in zip(trees, feature_maps, class_maps):
+            t = tree.tree_
+            nodes = np.arange(t.node_count)
+            leaf = t.children_left == -1
+            feature = np.where(leaf, 0, t.feature)
+            if feature_map is not None:
+                feature = np.asarray(feature_map)[feature]
+            # x <= threshold goes left, so work out where a 0 and a 1 go once per node
+            to_zero = np.where(leaf, nodes, np.where(0 <= t.threshold, t.children_left, t.children_right))
+            to_one = np.where(leaf, nodes, np.where(1 <= t.threshold, t.children_left, t.children_right))
+            value = t.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0] = 1
+            proba = np.zeros((t.node_count, n_classes))
+            proba[:, class_map] = value / normalizer # same normalization as DecisionTreeClassifier.predict_proba
+
+            features.append(feature)
+            children.append(np.stack([to_zero, to_one], axis=1).ravel() + offset)
+            values.append(proba)
+            roots.append(offset)
+            offset += t.node_count
+            self.max_depth = max(self.max_depth, t.max_depth)
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.byte = self.feature >> 3
+        self.shift = (self.feature & 7).astype(np.uint8)
+        self.children = np.concatenate(children).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Global leaf index for every (row, tree) pair of a PackedBits batch."""
+        if X.n_features <= self.feature.max():
+            raise ValueError(f"Model uses feature {self.feature.max()}, X only has {X.n_features}")
+        rows = np.arange(len(X))[:, None]
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.max_depth):
+            bit = (X.bits[rows, self.byte[node]] >> self.shift[node]) & 1
+            node = self.children[2 * node + bit]
+        return node
+
+    def staged_proba_sums(self, X, counts, chunk_rows=4096):
+        """{k: summed class probabilities of the first k trees} for every k in counts, in row chunks."""
+        counts = sorted(counts)
+        if counts[0] < 1 or counts[-1] > self.n_trees:
+            raise ValueError(f"counts must be between 1 and {self.n_trees}")
+        sums = {k: np.zeros((len(X), len(self.classes_))) for k in counts}
+        for start in range(0, len(X), chunk_rows):
+            leaves = self.apply(X[start:start + chunk_rows])
+            proba = np.zeros((leaves.shape[0], len(self.classes_)))
+            for k in range(1, counts[-1] + 1):
+                proba += self.value[leaves[:, k - 1]] # in tree order, like the sklearn ensembles
+                if k in sums:
+                    sums[k][start:start + chunk_rows] = proba
+        return sums
+
+    def predict_proba(self, X, chunk_rows=4096):
+        return self.staged_proba_sums(X, [self.n_trees], chunk_rows)[self.n_trees] / self.divisor
+
+    def predict(self, X, chunk_rows=4096):
+        return self.classes_[np.argmax(self.predict_proba(X, chunk_rows), axis=1)]
+
+    def staged_predict(self, X, counts, chunk_rows=4096):
+        """{k: predictions using only the first k trees}, the same as predict() on a k-tree ensemble."""
+        return {k: self.classes_[np.argmax(proba, axis=1)]
+                for k, proba in self.staged_proba_sums(X, counts, chunk_rows).items()}
@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+COLUMNS = ["classifier", "clauses", "examples", "search", "dataset_hash", "params", "accuracy", "f1",
+           "candidates", "search_seconds", "final_seconds", "peak_rss_mb", "finished_at"]
+
+
+class ResultStore:
+    """Finished sweep jobs in a SQLite file, one row per (classifier, clauses, examples, search, dataset).
+
+    Every job is written the moment its final fit is scored, so a crashed or interrupted sweep keeps
+    everything it finished. Each call opens its own connection, so the final-fit callbacks can record
+    from whatever thread they run on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                classifier TEXT, clauses INTEGER, examples INTEGER, search TEXT, dataset_hash TEXT,
+                params TEXT, accuracy REAL, f1 REAL, candidates INTEGER, search_seconds REAL,
+                final_seconds REAL, peak_rss_mb REAL, finished_at REAL,
+                PRIMARY KEY (classifier, clauses, examples, search, dataset_hash))""")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            with db: # commits, or rolls back on an exception
+                yield db
+        finally:
+            db.close()
+
+    def completed(self, search):
+        """{(classifier, clauses, examples, dataset_hash)} for every job already run with this search mode."""
+        with self._connect() as db:
+            rows = db.execute("SELECT classifier, clauses, examples, dataset_hash FROM jobs WHERE search = ?",
+                              (search,)).fetchall()
+        return set(rows)
+
+    def record(self, name, clauses, examples, search, result):
+        """Store one run_sweep result, replacing any earlier run of the same job on the same data."""
+        timings = result["timings"]
+        row = (name, clauses, examples, search, result["dataset_hash"], json.dumps(result["params"]),
+               result["accuracy"], result["f1"], len(timings), sum(t["seconds"] for t in timings),
+               result["final_seconds"], result.get("peak_rss_mb"), time.time())
+        with self._connect() as db:
+            db.execute(f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(COLUMNS))})", row)
+
+    def results(self, search=None):
+        """Every stored job as a dict, params decoded, ordered like the sweep loops."""
+        query = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+        args = ()
+        if search is not None:
+            query += " WHERE search = ?"
+            args = (search,)
+        with self._connect() as db:
+            rows = db.execute(query + " ORDER BY classifier, clauses, examples", args).fetchall()
+        results = [dict(zip(COLUMNS, row)) for row in rows]
+        for result in results:
+            result["params"] = json.loads(result["params"])
+        return results
@@ -7,96 +7,140 @@ Original file is located at
     https://colab.research.google.com/drive/1uCycmEtRBHmjxhVALjb7MlKV4gpqQTse
 """
 
-from sklearn.datasets import fetch_openml
-from sklearn.model_selection import train_test_split, StratifiedKFold, cross_val_score
+import argparse
+import os
+import sys
+import time
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.svm import SVC
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-
-# Fetch MNIST dataset
-mnist = fetch_openml('mnist_784', version=1, as_frame=False)
-X, y = mnist.data, mnist.target.astype(int)
-# Shuffle and split into 10k training and 10k testing
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, train_size=10000, test_size=10000, random_state=42, stratify=y)
-
-kernel_configs = {
-    'linear' : {},
-    'poly' : {'degree': [2,3]},
-    'rbf' : {'gamma': ['scale', 0.01, 0.001]}
-}
-
-C_values = [0.1, 1, 10]
-
-
-#Each fold has similar class distribution as original dataset
-cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-
-results = []
-
-#Cross-validation loop
-for kernel in kernel_configs:
-    params = kernel_configs[kernel]
-    if kernel == 'linear':
-        for C in C_values:
-            model = SVC(kernel='linear', C=C)
-            scores = cross_val_score(model, X_train, y_train, cv=cv, scoring='accuracy')
-            results.append(('linear', C, '-', '-', scores.mean(), scores.std()))
-    elif kernel == 'poly':
-        for degree in params['degree']:
-            for C in C_values:
-                model = SVC(kernel='poly', degree=degree, C=C)
-                scores = cross_val_score(model, X_train, y_train, cv=cv, scoring='accuracy')
-                results.append(('poly', C, degree, '-', scores.mean(), scores.std()))
-    elif kernel == 'rbf':
-        for gamma in params['gamma']:
-            for C in C_values:
-                model = SVC(kernel='rbf', gamma=gamma, C=C)
-                scores = cross_val_score(model, X_train, y_train, cv=cv, scoring='accuracy')
-                results.append(('rbf', C, '-', gamma, scores.mean(), scores.std()))
-
-# Results for each hyperparamater in a table.
-final_results = pd.DataFrame(results, columns=['Kernel', 'C', 'Degree', 'Gamma', 'Mean Accuracy', 'Std Accuracy'])
-print(final_results.sort_values(by='Mean Accuracy', ascending=False).reset_index(drop=True))
-#get best model, fit it on all of the training data, and then evaluate on the test set
-best_config = final_results.sort_values(by='Mean Accuracy', ascending=False).iloc[0]
-print(f"Best configuration: {best_config}")
-
-if best_config['Kernel'] == 'linear':
-    best_model = SVC(kernel='linear', C=best_config['C'])
-elif best_config['Kernel'] == 'poly':
-    best_model = SVC(kernel='poly', degree=best_config['Degree'], C=best_config['C'])
-else:
-    best_model = SVC(kernel='rbf', gamma=best_config['Gamma'], C=best_config['C'])
-
-best_model.fit(X_train, y_train)
-test_accuracy = best_model.score(X_test, y_test)
-print(f"Test Accuracy: {test_accuracy}")
-
-
-
-
-# Create graph for the results
-fig, axes = plt.subplots(1, 3, figsize=(18, 5), sharey=True)
-
-for ax, kernel in zip(axes, ['linear', 'poly', 'rbf']):
-    kernel_data = final_results[final_results['Kernel'] == kernel]
-
-    if kernel == 'linear':
-        labels = kernel_data['C'].astype(str)
-    elif kernel == 'poly':
-        labels = ['C=' + str(c) + ', deg=' + str(d) for c, d in zip(kernel_data['C'], kernel_data['Degree'])]
-    else:  # rbf
-        labels = ['C=' + str(c) + ', γ=' + str(g) for c, g in zip(kernel_data['C'], kernel_data['Gamma'])]
-
-    ax.errorbar(labels, kernel_data['Mean Accuracy'],
-                yerr=kernel_data['Std Accuracy'], fmt='o', capsize=5)
-    ax.set_title(f"{kernel.upper()} Kernel")
-    ax.set_xlabel("Hyperparameter Setting")
-    ax.set_ylabel("Mean Accuracy")
-    ax.tick_params(axis='x', rotation=45)
-
-fig.suptitle("Cross-Validation Accuracy by Kernel and Hyperparameters", fontsize=16)
-plt.tight_layout(rect=[0, 0, 1, 0.95])
-plt.show()
\ No newline at end of file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")) # mnist_store
+from mnist_store import load_mnist, scaled
+from svm_kernels import grid_configs, iter_grid_parallel, kernel_settings
+from approx_svm import StreamingKernelSVM
+
+# the grid runs on a process pool, which re-imports this file in every worker on Windows and macOS
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validate SVM kernels on MNIST.")
+    parser.add_argument("--n-jobs", type=int,
+                        help="processes for the CV grid, by default one per core that the available memory allows")
+    parser.add_argument("--approximate", choices=["nystroem", "rff"],
+                        help="also train the poly/RBF configs as linear SVMs on approximate kernel features, "
+                             "on every row outside the test set, and compare them with exact SVC")
+    parser.add_argument("--components", type=int, default=2000, help="approximate kernel feature count")
+    parser.add_argument("--epochs", type=int, default=5, help="passes over the data for the approximate mode")
+    args = parser.parse_args()
+
+    # MNIST as a uint8 memmap from the local store, only the first run downloads it
+    X, y = load_mnist()
+    # Shuffle and split into 10k training and 10k testing, by index so only those 20k rows get converted
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), train_size=10000, test_size=10000, random_state=42, stratify=y)
+    # raw 0-255 pixels as before, in float64 since that is what SVC works in
+    X_train, X_test = scaled(X, train_idx, scale=1, dtype=np.float64), scaled(X, test_idx, scale=1, dtype=np.float64)
+    y_train, y_test = y[train_idx], y[test_idx]
+
+    kernel_configs = {
+        'linear' : {},
+        'poly' : {'degree': [2,3]},
+        'rbf' : {'gamma': ['scale', 0.01, 0.001]}
+    }
+
+    C_values = [0.1, 1, 10]
+
+
+    #Each fold has similar class distribution as original dataset
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
+
+    #Cross-validation over the whole grid. Every kernel comes out of one shared Gram matrix of X_train
+    #(kernel='precomputed'). Each (kernel setting, fold) is one task on a process pool, poly/RBF first, and it
+    #fits every C on the fold kernels it builds once
+    n_jobs = args.n_jobs
+
+    # Results for each hyperparamater in a table, filled in as each config's folds finish
+    final_results = pd.DataFrame(columns=['Kernel', 'C', 'Degree', 'Gamma', 'Mean Accuracy', 'Std Accuracy'])
+    for index, row in iter_grid_parallel(X_train, y_train, kernel_configs, C_values, cv, n_jobs=n_jobs):
+        final_results.loc[index] = row
+        kernel, C, degree, gamma, mean, std = row
+        print(f"[{len(final_results)}/{len(C_values) * len(kernel_settings(kernel_configs))}] "
+              f"{kernel} C={C} degree={degree} gamma={gamma}: {mean:.4f} +/- {std:.4f}")
+    final_results = final_results.sort_index().infer_objects() # back in grid order for the plots
+    print(final_results.sort_values(by='Mean Accuracy', ascending=False).reset_index(drop=True))
+    #get best model, fit it on all of the training data, and then evaluate on the test set
+    best_config = final_results.sort_values(by='Mean Accuracy', ascending=False).iloc[0]
+    print(f"Best configuration: {best_config}")
+
+    if best_config['Kernel'] == 'linear':
+        best_model = SVC(kernel='linear', C=best_config['C'])
+    elif best_config['Kernel'] == 'poly':
+        best_model = SVC(kernel='poly', degree=best_config['Degree'], C=best_config['C'])
+    else:
+        best_model = SVC(kernel='rbf', gamma=best_config['Gamma'], C=best_config['C'])
+
+    start = time.perf_counter()
+    best_model.fit(X_train, y_train)
+    exact_seconds = time.perf_counter() - start
+    test_accuracy = best_model.score(X_test, y_test)
+    print(f"Test Accuracy: {test_accuracy}")
+
+    # Approximate kernels: Nyström/random Fourier features + a linear SVM streamed in minibatches, which is
+    # cheap enough to train on all 60k rows outside the test set instead of 10k
+    if args.approximate:
+        approx_idx = np.setdiff1d(np.arange(len(y)), test_idx)
+        approx_rows = []
+        for kernel, C, degree, gamma in grid_configs(kernel_configs, C_values):
+            if kernel == 'linear' or (kernel == 'poly' and args.approximate == 'rff'):
+                continue # nothing to approximate / no random Fourier features for poly
+            model = StreamingKernelSVM(kernel, C, 'scale' if gamma == '-' else gamma, 3 if degree == '-' else degree,
+                                       method=args.approximate, n_components=args.components, epochs=args.epochs)
+            start = time.perf_counter()
+            model.fit(X, y, approx_idx)
+            seconds = time.perf_counter() - start
+            accuracy = model.score(X, y, test_idx)
+            approx_rows.append((kernel, C, degree, gamma, accuracy, seconds))
+            print(f"{args.approximate} {kernel} C={C} degree={degree} gamma={gamma}: "
+                  f"test accuracy {accuracy:.4f}, fit {seconds:.1f}s on {len(approx_idx)} samples")
+        approx_results = pd.DataFrame(approx_rows, columns=['Kernel', 'C', 'Degree', 'Gamma',
+                                                            'Approx Test Accuracy', 'Approx Fit Seconds'])
+        comparison = final_results.merge(approx_results, on=['Kernel', 'C', 'Degree', 'Gamma'])
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(comparison.sort_values(by='Approx Test Accuracy', ascending=False).reset_index(drop=True))
+        print(f"Exact SVC, best config: test accuracy {test_accuracy:.4f}, fit {exact_seconds:.1f}s on {len(train_idx)} samples")
+        same = comparison[(comparison['Kernel'] == best_config['Kernel']) & (comparison['C'] == best_config['C'])
+                          & (comparison['Degree'] == best_config['Degree']) & (comparison['Gamma'] == best_config['Gamma'])]
+        if len(same):
+            print(f"Approximate, same config: test accuracy {same['Approx Test Accuracy'].iloc[0]:.4f}, "
+                  f"fit {same['Approx Fit Seconds'].iloc[0]:.1f}s on {len(approx_idx)} samples")
+        best_approx = approx_results.sort_values(by='Approx Test Accuracy', ascending=False).iloc[0]
+        print(f"Approximate, best config: {best_approx['Kernel']} C={best_approx['C']} degree={best_approx['Degree']} "
+              f"gamma={best_approx['Gamma']}: test accuracy {best_approx['Approx Test Accuracy']:.4f}, "
+              f"fit {best_approx['Approx Fit Seconds']:.1f}s")
+
+
+
+
+    # Create graph for the results
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5), sharey=True)
+
+    for ax, kernel in zip(axes, ['linear', 'poly', 'rbf']):
+        kernel_data = final_results[final_results['Kernel'] == kernel]
+
+        if kernel == 'linear':
+            labels = kernel_data['C'].astype(str)
+        elif kernel == 'poly':
+            labels = ['C=' + str(c) + ', deg=' + str(d) for c, d in zip(kernel_data['C'], kernel_data['Degree'])]
+        else:  # rbf
+            labels = ['C=' + str(c) + ', γ=' + str(g) for c, g in zip(kernel_data['C'], kernel_data['Gamma'])]
+
+        ax.errorbar(labels, kernel_data['Mean Accuracy'],
+                    yerr=kernel_data['Std Accuracy'], fmt='o', capsize=5)
+        ax.set_title(f"{kernel.upper()} Kernel")
+        ax.set_xlabel("Hyperparameter Setting")
+        ax.set_ylabel("Mean Accuracy")
+        ax.tick_params(axis='x', rotation=45)
+
+    fig.suptitle("Cross-Validation Accuracy by Kernel and Hyperparameters", fontsize=16)
+    plt.tight_layout(rect=[0, 0, 1, 0.95])
+    plt.show()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import numpy as np
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")) # mnist_store
+from mnist_store import iter_scaled, scaled
+
+
+class StreamingKernelSVM:
+    """A linear SVM on approximate kernel features, so training cost grows linearly with the samples.
+
+    Rows are mapped through Nyström features (rbf or poly) or random Fourier features (rbf only) and a
+    hinge-loss SGDClassifier is trained on them with partial_fit, one minibatch at a time, straight from
+    the uint8 MNIST store. Only a minibatch of mapped features is ever in memory. C, gamma and degree
+    mean what they mean for SVC(kernel=kernel), gamma="scale" included, and C sets the SGD penalty
+    alpha = 1 / (C * n_samples).
+    """
+
+    def __init__(self, kernel="rbf", C=1.0, gamma="scale", degree=3, method="nystroem", n_components=2000,
+                 batch_size=2000, epochs=5, scale=1.0, random_state=42):
+        self.kernel = kernel
+        self.C = C
+        self.gamma = gamma
+        self.degree = degree
+        self.method = method
+        self.n_components = n_components
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.scale = scale
+        self.random_state = random_state
+
+    def _feature_map(self, gamma):
+        if self.method == "nystroem":
+            if self.kernel not in ("rbf", "poly"):
+                raise ValueError(f"Nyström features are for 'rbf' or 'poly', not {self.kernel!r}")
+            # coef0=0 is SVC's poly kernel, Nystroem would otherwise default to 1
+            return Nystroem(kernel=self.kernel, gamma=gamma, degree=self.degree, coef0=0,
+                            n_components=self.n_components, random_state=self.random_state)
+        if self.method == "rff":
+            if self.kernel != "rbf":
+                raise ValueError(f"Random Fourier features only approximate 'rbf', not {self.kernel!r}")
+            return RBFSampler(gamma=gamma, n_components=self.n_components, random_state=self.random_state)
+        raise ValueError(f"Unknown method {self.method!r}, expected 'nystroem' or 'rff'")
+
+    def fit(self, X, y, rows=None):
+        """Train on X[rows] (all rows by default). X can be the uint8 memmap from load_mnist."""
+        rows = np.arange(X.shape[0]) if rows is None else np.asarray(rows)
+        y = np.asarray(y)
+        rng = np.random.default_rng(self.random_state)
+        # the landmarks for Nyström, and the rows gamma="scale" takes the pixel variance from
+        sample = rng.choice(rows, min(max(self.n_components, 10000), len(rows)), replace=False)
+        read_order = np.argsort(sample) # read the memmap in row order, the draw itself stays in random order
+        X_sample = scaled(X, sample[read_order], scale=self.scale, dtype=np.float64)
+        gamma = self.gamma
+        if gamma == "scale":
+            gamma = 1.0 / (X.shape[1] * X_sample.var())
+        elif gamma == "auto":
+            gamma = 1.0 / X.shape[1]
+        self.gamma_ = gamma
+        # the first n_components rows of the random draw, not the lowest-index rows of the sample
+        landmarks = np.argsort(read_order)[:self.n_components]
+        self.feature_map_ = self._feature_map(gamma).fit(X_sample[landmarks])
+        del X_sample
+
+        self.classifier_ = SGDClassifier(loss="hinge", alpha=1.0 / (self.C * len(rows)),
+                                         random_state=self.random_state)
+        classes = np.unique(y[rows])
+        for _ in range(self.epochs):
+            order = rng.permutation(rows)
+            for start, batch in iter_scaled(X, order, chunk_rows=self.batch_size, scale=self.scale, dtype=np.float64):
+                labels = y[order[start:start + self.batch_size]]
+                self.classifier_.partial_fit(self.feature_map_.transform(batch), labels, classes=classes)
+        return self
+
+    def predict(self, X, rows=None):
+        """Predicted labels for X[rows], mapped a minibatch at a time."""
+        rows = np.arange(X.shape[0]) if rows is None else np.asarray(rows)
+        predictions = np.empty(len(rows), dtype=self.classifier_.classes_.dtype)
+        for start, batch in iter_scaled(X, rows, chunk_rows=self.batch_size, scale=self.scale, dtype=np.float64):
+            predictions[start:start + len(batch)] = self.classifier_.predict(self.feature_map_.transform(batch))
+        return predictions
+
+    def score(self, X, y, rows=None):
+        """Accuracy on X[rows]."""
+        y = np.asarray(y)
+        return np.mean(self.predict(X, rows) == (y if rows is None else y[rows]))
@@ -0,0 +1,222 @@
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from sklearn.svm import SVC
+
+
+class GramCache:
+    """Every kernel the CV grid needs, derived from one float32 dot-product matrix of the training rows.
+
+    Linear, poly and RBF kernels on any pair of row subsets (a fold's training rows against themselves
+    or against its held-out rows) are slices and elementwise functions of X @ X.T, so the 784-wide
+    products are computed once for the whole grid instead of inside every libsvm fit.
+    """
+
+    def __init__(self, X, block_rows=2048, out=None):
+        """out is an optional preallocated float32 n x n buffer for the dot products (e.g. shared memory)."""
+        X = np.asarray(X, dtype=np.float32)
+        n = X.shape[0]
+        self.n_features = X.shape[1]
+        self.dot = np.empty((n, n), dtype=np.float32) if out is None else out
+        for start in range(0, n, block_rows): # a block of rows at a time, never a float64 n x n temporary
+            np.dot(X[start:start + block_rows], X.T, out=self.dot[start:start + block_rows])
+        self.sq_norms = np.einsum("ij,ij->i", X, X, dtype=np.float64)
+        # per-row sums for gamma="scale", which needs the variance of each fold's training rows
+        self.row_sums = X.sum(axis=1, dtype=np.float64)
+        self.row_sq_sums = self.sq_norms
+
+    @classmethod
+    def from_arrays(cls, dot, sq_norms, row_sums, n_features):
+        """A cache over already computed arrays, how pool workers wrap the shared dot-product matrix."""
+        cache = cls.__new__(cls)
+        cache.dot, cache.sq_norms, cache.row_sums, cache.n_features = dot, sq_norms, row_sums, n_features
+        cache.row_sq_sums = sq_norms
+        return cache
+
+    def gamma(self, gamma, rows):
+        """The gamma SVC would use when fit on rows, resolving "scale" and "auto" like sklearn does."""
+        if gamma == "scale":
+            count = len(rows) * self.n_features
+            mean = self.row_sums[rows].sum() / count
+            variance = self.row_sq_sums[rows].sum() / count - mean ** 2
+            return 1.0 / (self.n_features * variance) if variance != 0 else 1.0
+        if gamma == "auto":
+            return 1.0 / self.n_features
+        return float(gamma)
+
+    def kernel(self, kernel, rows, cols, gamma="scale", degree=3, coef0=0.0):
+        """K(X[rows], X[cols]) in float64 for SVC(kernel="precomputed"), with gamma resolved on cols,
+        the training rows the model is fit on."""
+        K = self.dot[np.ix_(rows, cols)].astype(np.float64)
+        if kernel == "linear":
+            return K
+        g = self.gamma(gamma, cols)
+        if kernel == "poly":
+            K *= g
+            K += coef0
+            return np.power(K, degree, out=K)
+        if kernel == "rbf":
+            # ||x - y||^2 = |x|^2 + |y|^2 - 2 x.y, clipped at 0 against rounding
+            K *= -2
+            K += self.sq_norms[rows][:, None]
+            K += self.sq_norms[cols][None, :]
+            np.maximum(K, 0, out=K)
+            K *= -g
+            return np.exp(K, out=K)
+        raise ValueError(f"Unknown kernel {kernel!r}, expected 'linear', 'poly' or 'rbf'")
+
+
+def kernel_settings(kernel_configs):
+    """(kernel, degree, gamma) for every non-C setting, '-' where the kernel has no such parameter,
+    in the order the original nested loops visited them."""
+    settings = []
+    for kernel, params in kernel_configs.items():
+        for degree in params.get("degree", ["-"]):
+            for gamma in params.get("gamma", ["-"]):
+                settings.append((kernel, degree, gamma))
+    return settings
+
+
+def cross_validate_precomputed(X, y, kernel_configs, C_values, cv):
+    """The same grid as cross_val_score(SVC(...), X, y, cv=cv) per config, on a GramCache.
+
+    Each (kernel setting, fold) kernel matrix is built once and shared by every C. Returns
+    [(kernel, C, degree, gamma, mean accuracy, std accuracy)] in the original loop order.
+    """
+    y = np.asarray(y)
+    cache = GramCache(X)
+    folds = list(cv.split(X, y))
+    scores = {}
+    for kernel, degree, gamma in kernel_settings(kernel_configs):
+        for train, test in folds:
+            options = {"gamma": "scale" if gamma == "-" else gamma, "degree": 3 if degree == "-" else degree}
+            K_train = cache.kernel(kernel, train, train, **options)
+            K_test = cache.kernel(kernel, test, train, **options)
+            for C in C_values:
+                model = SVC(kernel="precomputed", C=C).fit(K_train, y[train])
+                scores.setdefault((kernel, C, degree, gamma), []).append(np.mean(model.predict(K_test) == y[test]))
+    return [(kernel, C, degree, gamma, np.mean(fold_scores), np.std(fold_scores))
+            for (kernel, C, degree, gamma), fold_scores in scores.items()]
+
+
+def grid_configs(kernel_configs, C_values):
+    """Every (kernel, C, degree, gamma) of the grid, in the original loop order."""
+    return [(kernel, C, degree, gamma) for kernel, degree, gamma in kernel_settings(kernel_configs) for C in C_values]
+
+
+def expected_cost(setting):
+    """Sort key for scheduling kernel settings, bigger runs first. Poly and RBF take libsvm more iterations
+    than linear, and higher degrees more than lower ones."""
+    kernel, degree, gamma = setting
+    return kernel != "linear", degree if degree != "-" else 1
+
+
+def available_memory():
+    """Bytes of physical memory available for new allocations, or None where it can't be read."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError): # no sysconf on Windows
+        return None
+
+
+def fold_kernel_bytes(folds):
+    """Peak bytes one worker needs for its float64 fold kernels: K_train and K_test of the largest fold,
+    plus the float32 Gram slice each is converted from."""
+    return max(len(train) * (len(train) + len(test)) * 12 for train, test in folds)
+
+
+def default_n_jobs(folds, reserved=0):
+    """One worker per core, but no more than the available memory (less reserved bytes) can hold fold
+    kernels for."""
+    n_jobs = os.cpu_count() or 1
+    memory = available_memory()
+    if memory is not None:
+        n_jobs = min(n_jobs, max(1, (memory - reserved) // fold_kernel_bytes(folds)))
+    return n_jobs
+
+
+_worker = {}
+
+
+def _attach(name):
+    # only the parent owns (and unlinks) the block, workers must not register it with the resource tracker
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    return SharedMemory(name=name)
+
+
+def _init_worker(shm_name, n, sq_norms, row_sums, n_features, y, folds):
+    shm = _attach(shm_name)
+    dot = np.ndarray((n, n), dtype=np.float32, buffer=shm.buf)
+    _worker.update(shm=shm, cache=GramCache.from_arrays(dot, sq_norms, row_sums, n_features), y=y, folds=folds)
+
+
+def _fit_fold(setting, fold, C_values):
+    kernel, degree, gamma = setting
+    train, test = _worker["folds"][fold]
+    options = {"gamma": "scale" if gamma == "-" else gamma, "degree": 3 if degree == "-" else degree}
+    K_train = _worker["cache"].kernel(kernel, train, train, **options)
+    K_test = _worker["cache"].kernel(kernel, test, train, **options)
+    y = _worker["y"]
+    accuracies = []
+    for C in C_values: # every C reuses the fold kernels built above
+        model = SVC(kernel="precomputed", C=C).fit(K_train, y[train])
+        accuracies.append(np.mean(model.predict(K_test) == y[test]))
+    return setting, fold, accuracies
+
+
+def iter_grid_parallel(X, y, kernel_configs, C_values, cv, n_jobs=None):
+    """cross_validate_precomputed on a process pool, one task per (kernel setting, fold), most expensive first.
+
+    The Gram matrix is computed once into shared memory and every worker maps it rather than receiving a
+    pickled copy. A task builds the float64 fold kernels for its setting once (about 0.5 GB for 10k rows)
+    and fits every C on them. n_jobs defaults to default_n_jobs, the cores the available memory can
+    feed. Yields (grid index, result row) as soon as all folds of a config are scored, so rows arrive in
+    completion order; the grid index is the config's position in the original loop order.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    folds = list(cv.split(X, y))
+    settings = kernel_settings(kernel_configs)
+    index = {config: i for i, config in enumerate(grid_configs(kernel_configs, C_values))}
+    tasks = sorted(((setting, fold) for setting in settings for fold in range(len(folds))),
+                   key=lambda task: expected_cost(task[0]), reverse=True)
+    shm = SharedMemory(create=True, size=max(n * n * 4, 1))
+    n_jobs = min(n_jobs or default_n_jobs(folds), len(tasks)) # available memory is read after the Gram block
+    cache = None
+    try:
+        cache = GramCache(X, out=np.ndarray((n, n), dtype=np.float32, buffer=shm.buf))
+        scores = {}
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                 initargs=(shm.name, n, cache.sq_norms, cache.row_sums, cache.n_features, y, folds)) as pool:
+            pending = {pool.submit(_fit_fold, setting, fold, C_values) for setting, fold in tasks}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        setting, fold, accuracies = future.result()
+                        fold_scores = scores.setdefault(setting, {})
+                        fold_scores[fold] = accuracies
+                        if len(fold_scores) == len(folds):
+                            kernel, degree, gamma = setting
+                            for c, C in enumerate(C_values):
+                                per_fold = [fold_scores[f][c] for f in range(len(folds))]
+                                yield index[(kernel, C, degree, gamma)], (kernel, C, degree, gamma,
+                                                                          np.mean(per_fold), np.std(per_fold))
+            finally:
+                for future in pending: # stopped early, don't run the rest of the grid on the way out
+                    future.cancel()
+    finally:
+        cache = None # the dot-product view has to go before the block can be closed
+        shm.close()
+        shm.unlink()
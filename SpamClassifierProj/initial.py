@@ -1,42 +1,264 @@
 
 import csv
+import hashlib
 import os
+import zipfile
 import numpy as np
 import math
+import numbers
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords, framenet15
 from nltk.stem import WordNetLemmatizer
-from nltk.probability import FreqDist
 from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.model_selection import train_test_split
-import cProfile
+from sklearn.model_selection import StratifiedKFold
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from collections import Counter
+from scipy import sparse
+from scipy.optimize import minimize
+from spam_metrics import classification_metrics
+
+# Per-process preprocessing state, built once by _init_preprocess_worker instead of once per email
+_stop_words = None
+_lemmatizer = None
+
+def _init_preprocess_worker():
+    global _stop_words, _lemmatizer
+    _stop_words = frozenset(stopwords.words("english"))
+    _lemmatizer = WordNetLemmatizer()
+    _lemmatize.cache_clear()
+
+@lru_cache(maxsize=200000)
+def _lemmatize(word):
+    return _lemmatizer.lemmatize(word) # emails repeat the same words a lot, so memoize
 
 def preprocess_email(text):
     """Clean and preprocess email text."""
+    if _stop_words is None:
+        _init_preprocess_worker()
     text = text.lower()  # Convert to lowercase
     tokens = word_tokenize(text)  # Tokenize words
     tokens = [word for word in tokens if word.isalpha()]  # Remove punctuation
-    stop_words = set(stopwords.words("english"))
-    tokens = [word for word in tokens if word not in stop_words and len(word) > 1]  # Remove stopwords
-    lemmatizer = WordNetLemmatizer()
-    tokens = [lemmatizer.lemmatize(word) for word in tokens]
+    tokens = [word for word in tokens if word not in _stop_words and len(word) > 1]  # Remove stopwords
+    tokens = [_lemmatize(word) for word in tokens]
     return " ".join(tokens)  # Return processed text as a string
 
-def load_and_preprocess_emails(directory):
-    emails, labels = [], []
+def list_email_files(directory):
+    """Return (file_path, label) pairs for the ham (0) and spam (1) folders under directory."""
+    files = []
     for label, folder in enumerate(["ham", "spam"]):  # 0 for ham, 1 for spam
         folder_path = os.path.join(directory, folder)
         if not os.path.exists(folder_path):
             continue
         for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-                raw_text = file.read()
-                processed_text = preprocess_email(raw_text)
-                emails.append(processed_text)
-                labels.append(label)
+            files.append((os.path.join(folder_path, filename), label))
+    return files
+
+def _preprocess_files(chunk):
+    processed = []
+    for file_path, label in chunk:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
+            processed.append((preprocess_email(file.read()), label))
+    return processed
+
+def iter_preprocessed_emails(directory, n_jobs=None, chunksize=64):
+    """Stream (processed_text, label) pairs, reading and tokenizing chunks of files in a process pool.
+
+    Results come back in the same order as list_email_files. n_jobs=1 runs everything in this process.
+    """
+    files = list_email_files(directory)
+    chunks = [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield from _preprocess_files(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_preprocess_worker) as pool:
+        for processed in pool.map(_preprocess_files, chunks):
+            yield from processed
+
+def _preprocess_texts(chunk):
+    return [preprocess_email(text) for text in chunk]
+
+def preprocess_texts(texts, n_jobs=None, chunksize=64):
+    """Preprocess already-read email texts in a process pool, keeping their order."""
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    if n_jobs == 1 or len(chunks) <= 1:
+        return [processed for chunk in chunks for processed in _preprocess_texts(chunk)]
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_preprocess_worker) as pool:
+        return [processed for result in pool.map(_preprocess_texts, chunks) for processed in result]
+
+# Bump whenever preprocess_email changes so old cache entries stop matching
+PREPROCESS_VERSION = 1
+
+def preprocess_cache_path(cache_dir):
+    """Cache file for the current preprocessing config; a config change means a different file."""
+    config = f"v{PREPROCESS_VERSION}|nltk={nltk.__version__}|lower|alpha|english-stopwords|min-len=2|wordnet"
+    config_hash = hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"preprocessed_{config_hash}.npz")
+
+def load_preprocess_cache(cache_dir):
+    """Load the {sha256 digest of raw email: processed text} cache, or an empty dict if there isn't one."""
+    path = preprocess_cache_path(cache_dir)
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as cached:
+        keys, offsets, data = cached["keys"], cached["offsets"], cached["data"].tobytes()
+    return {keys[i].tobytes(): data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(keys))}
+
+def save_preprocess_cache(cache_dir, cache):
+    """Write the cache as one .npz: raw 32-byte digests, and all texts as one UTF-8 blob plus offsets."""
+    os.makedirs(cache_dir, exist_ok=True)
+    encoded = [text.encode("utf-8") for text in cache.values()]
+    keys = np.frombuffer(b"".join(cache.keys()), dtype=np.uint8).reshape(len(cache), 32)
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    path = preprocess_cache_path(cache_dir)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, keys=keys, offsets=offsets, data=data)
+    os.replace(tmp_path, path) # don't leave a half-written cache behind if we get interrupted
+
+def load_and_preprocess_emails(directory, n_jobs=None, chunksize=64, cache_dir=None):
+    """Load and preprocess the ham/spam emails under directory.
+
+    With cache_dir, emails are looked up by the hash of their raw content and only new or changed
+    emails are preprocessed; the cache is then updated on disk.
+    """
+    if cache_dir is None:
+        emails, labels = [], []
+        for processed_text, label in iter_preprocessed_emails(directory, n_jobs=n_jobs, chunksize=chunksize):
+            emails.append(processed_text)
+            labels.append(label)
+        return emails, labels
+
+    return _preprocess_with_cache(_iter_raw_email_files(directory), cache_dir, n_jobs=n_jobs, chunksize=chunksize)
+
+def _iter_raw_email_files(directory):
+    for file_path, label in list_email_files(directory):
+        with open(file_path, "rb") as file:
+            yield file.read(), label
+
+def _preprocess_with_cache(raw_emails, cache_dir, n_jobs=None, chunksize=64):
+    """Preprocess (raw bytes, label) pairs, only running preprocess_email on emails not already cached."""
+    cache = load_preprocess_cache(cache_dir)
+    digests, labels = [], []
+    missing = {} # digest -> raw text, dict also dedupes identical emails
+    for raw, label in raw_emails:
+        digest = hashlib.sha256(raw).digest()
+        digests.append(digest)
+        labels.append(label)
+        if digest not in cache:
+            missing[digest] = raw.decode("utf-8", errors="ignore")
+
+    if missing:
+        processed = preprocess_texts(list(missing.values()), n_jobs=n_jobs, chunksize=chunksize)
+        cache.update(zip(missing.keys(), processed))
+        save_preprocess_cache(cache_dir, cache)
+    return [cache[digest] for digest in digests], labels
+
+def list_zip_email_members(zip_path):
+    """Return (member_name, label) pairs for the emails inside a ham/ or spam/ folder of the archive.
+
+    The folder layout is detected from the member names, so both enron1/train/ham/... and
+    train/ham/... (enron2) work without special cases.
+    """
+    members = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            parts = info.filename.split("/")
+            if info.is_dir() or parts[0] == "__MACOSX" or parts[-1].startswith("._"):
+                continue
+            if len(parts) >= 2 and parts[-2] in ("ham", "spam"):
+                members.append((info.filename, 0 if parts[-2] == "ham" else 1)) # 0 for ham, 1 for spam
+    members.sort(key=lambda member: (member[1], member[0])) # ham first, then spam, like list_email_files
+    return members
+
+def iter_zip_raw_emails(zip_path):
+    """Lazily yield (raw bytes, label) for every email in the archive without extracting it."""
+    with zipfile.ZipFile(zip_path) as archive:
+        for member_name, label in list_zip_email_members(zip_path):
+            yield archive.read(member_name), label
+
+def _preprocess_zip_members(args):
+    zip_path, chunk = args
+    # every chunk opens the archive itself: reading the zip directory is cheap next to preprocessing 64
+    # emails, and nothing is left open in the workers or this process afterwards
+    with zipfile.ZipFile(zip_path) as archive:
+        return [(preprocess_email(archive.read(member_name).decode("utf-8", errors="ignore")), label)
+                for member_name, label in chunk]
+
+def iter_preprocessed_zip_emails(zip_path, n_jobs=None, chunksize=64):
+    """Stream (processed_text, label) pairs straight out of a zip archive.
+
+    Each worker opens the archive itself and decompresses and preprocesses its own chunk of members.
+    """
+    members = list_zip_email_members(zip_path)
+    chunks = [(zip_path, members[i:i + chunksize]) for i in range(0, len(members), chunksize)]
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield from _preprocess_zip_members(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_preprocess_worker) as pool:
+        for processed in pool.map(_preprocess_zip_members, chunks):
+            yield from processed
+
+# Digests already in the preprocess cache, handed to each worker once by _init_zip_cache_worker
+_cached_digests = frozenset()
+
+def _init_zip_cache_worker(cached_digests):
+    global _cached_digests
+    _init_preprocess_worker()
+    _cached_digests = cached_digests
+
+def _digest_zip_members(args, cached_digests=None):
+    zip_path, chunk = args
+    cached_digests = _cached_digests if cached_digests is None else cached_digests
+    results = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for member_name, label in chunk:
+            raw = archive.read(member_name)
+            digest = hashlib.sha256(raw).digest()
+            processed = None if digest in cached_digests else preprocess_email(raw.decode("utf-8", errors="ignore"))
+            results.append((digest, label, processed))
+    return results
+
+def _preprocess_zip_with_cache(zip_path, cache_dir, n_jobs=None, chunksize=64):
+    """Cached version of iter_preprocessed_zip_emails. Workers decompress and hash their own members and
+    only preprocess the ones whose digest isn't cached yet, so a cold cache is filled in parallel too."""
+    cache = load_preprocess_cache(cache_dir)
+    members = list_zip_email_members(zip_path)
+    chunks = [(zip_path, members[i:i + chunksize]) for i in range(0, len(members), chunksize)]
+    if n_jobs == 1:
+        results = (_digest_zip_members(chunk, cache.keys()) for chunk in chunks)
+        return _merge_cached(results, cache, cache_dir)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_zip_cache_worker,
+                             initargs=(frozenset(cache),)) as pool:
+        return _merge_cached(pool.map(_digest_zip_members, chunks), cache, cache_dir)
+
+def _merge_cached(results, cache, cache_dir):
+    digests, labels, new = [], [], {}
+    for chunk in results:
+        for digest, label, processed in chunk:
+            digests.append(digest)
+            labels.append(label)
+            if processed is not None:
+                new[digest] = processed
+    if new:
+        cache.update(new)
+        save_preprocess_cache(cache_dir, cache)
+    return [cache[digest] for digest in digests], labels
+
+def load_and_preprocess_zip(zip_path, n_jobs=None, chunksize=64, cache_dir=None):
+    """Zip archive version of load_and_preprocess_emails."""
+    if cache_dir is not None:
+        return _preprocess_zip_with_cache(zip_path, cache_dir, n_jobs=n_jobs, chunksize=chunksize)
+    emails, labels = [], []
+    for processed_text, label in iter_preprocessed_zip_emails(zip_path, n_jobs=n_jobs, chunksize=chunksize):
+        emails.append(processed_text)
+        labels.append(label)
     return emails, labels
+
 def train_multinomial_nb(X_train, y_train, vocabulary):
         num_docs = len(y_train) # Total emails
 
@@ -109,7 +331,7 @@ def train_discrete_nb(X_train, y_train, vocabulary):
             Word_counts_for_class = np.sum(emails_with_class, axis=0) #  is # ((Xj = 1, Y = c))
             #summing column wise
 
-            conditional_probability = ( Word_counts_for_class + 1) / (N_emails_with_class + 2)
+            conditional_probability[c] = ( Word_counts_for_class + 1) / (N_emails_with_class + 2)
             # Get 2-D array of conditional probabilities
             # conditional_prob[1] = [ #(X1 = 1, Y = 1], #(X2 = 1, Y = 1), . . .]
             # conditional_prob[0] = [ #(X1 = 1, Y = 0], #(X2 = 1, Y = 0), . . .]
@@ -152,6 +374,240 @@ def pred_multinomial_nb(X_test, prior_spam, prior_ham, cond_prob_spam, cond_prob
 
     return predictions
 
+class VocabularyBuilder:
+    """Single-pass word and document frequency counts for building the feature vocabulary.
+
+    With capacity=None every word is counted exactly. With a capacity, a Space-Saving summary keeps at
+    most ~2 * capacity words in memory: when it fills up the smallest counts are evicted, and a word
+    seen for the first time afterwards starts at the largest evicted count (an overestimate that is
+    never off by more than that floor). Builders from parallel workers can be combined with merge().
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.num_docs = 0
+        self.word_counts = {}
+        self.doc_counts = {}
+        self.count_floor = 0 # largest evicted word count, 0 while exact
+        self.doc_floor = 0
+
+    def update(self, tokens):
+        """Add one document's tokens."""
+        self.num_docs += 1
+        for word, count in Counter(tokens).items():
+            if word in self.word_counts:
+                self.word_counts[word] += count
+                self.doc_counts[word] += 1
+            else:
+                self.word_counts[word] = self.count_floor + count
+                self.doc_counts[word] = self.doc_floor + 1
+        if self.capacity is not None and len(self.word_counts) > 2 * self.capacity:
+            self._prune()
+        return self
+
+    def update_many(self, emails):
+        """Add processed emails (space separated tokens, as returned by load_and_preprocess_emails)."""
+        for email in emails:
+            self.update(email.split())
+        return self
+
+    def _prune(self):
+        # evict everything below the capacity-th largest count in one go, so eviction is amortized O(1)
+        words = list(self.word_counts)
+        counts = np.fromiter(self.word_counts.values(), dtype=np.int64, count=len(words))
+        keep = np.argsort(-counts, kind="stable")[:self.capacity]
+        keep_mask = np.zeros(len(words), dtype=bool)
+        keep_mask[keep] = True
+        for i in np.flatnonzero(~keep_mask):
+            self.count_floor = max(self.count_floor, self.word_counts.pop(words[i]))
+            self.doc_floor = max(self.doc_floor, self.doc_counts.pop(words[i]))
+
+    def merge(self, other):
+        """Merge another builder's counts into this one, e.g. partial vocabularies from pool workers."""
+        for word in set(self.word_counts) | set(other.word_counts):
+            # a word missing from a summary may have been evicted there, so it could have up to its floor
+            self.word_counts[word] = (self.word_counts.get(word, self.count_floor)
+                                      + other.word_counts.get(word, other.count_floor))
+            self.doc_counts[word] = (self.doc_counts.get(word, self.doc_floor)
+                                     + other.doc_counts.get(word, other.doc_floor))
+        self.count_floor += other.count_floor
+        self.doc_floor += other.doc_floor
+        self.num_docs += other.num_docs
+        if self.capacity is not None and len(self.word_counts) > self.capacity:
+            self._prune()
+        return self
+
+    def most_common(self, k, min_df=1, max_df=1.0):
+        """The k most frequent words whose document frequency is within [min_df, max_df].
+
+        Like CountVectorizer, an int min_df/max_df is a document count and a float is a fraction of documents.
+        """
+        min_docs = min_df if isinstance(min_df, numbers.Integral) else min_df * self.num_docs
+        max_docs = max_df if isinstance(max_df, numbers.Integral) else max_df * self.num_docs
+        words = [word for word, docs in self.doc_counts.items() if min_docs <= docs <= max_docs]
+        words.sort(key=lambda word: (-self.word_counts[word], word)) # ties broken alphabetically
+        return words[:k]
+
+def _count_vocabulary(args):
+    emails, capacity = args
+    return VocabularyBuilder(capacity).update_many(emails)
+
+def build_vocabulary(emails, k=3000, min_df=1, max_df=1.0, capacity=None, n_jobs=1, chunksize=2000):
+    """Top-k vocabulary of the processed emails, counted in chunks across a process pool when n_jobs != 1."""
+    chunks = [(emails[i:i + chunksize], capacity) for i in range(0, len(emails), chunksize)]
+    builder = VocabularyBuilder(capacity)
+    if n_jobs == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            builder.merge(_count_vocabulary(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            for partial in pool.map(_count_vocabulary, chunks):
+                builder.merge(partial)
+    return builder.most_common(k, min_df=min_df, max_df=max_df)
+
+def save_feature_matrix(path, X, labels, vocabulary, compressed=True):
+    """Save a sparse feature matrix as CSR arrays in one .npz, together with its labels and vocabulary."""
+    X = sparse.csr_matrix(X)
+    data = X.data
+    if np.issubdtype(data.dtype, np.integer) and data.size:
+        data = data.astype(np.min_scalar_type(data.max())) # word counts fit in a byte or two
+    save = np.savez_compressed if compressed else np.savez
+    save(path, data=data, indices=X.indices.astype(np.int32), indptr=X.indptr.astype(np.int64),
+         shape=np.array(X.shape), labels=np.asarray(labels, dtype=np.int8),
+         vocabulary=np.asarray(vocabulary, dtype=str))
+
+def load_feature_matrix(path):
+    """Load a file written by save_feature_matrix. Returns (X as CSR, labels, vocabulary list).
+
+    Counts and labels are stored in the smallest dtype that fits and come back as int64, like the old
+    csv path, so arithmetic on the loaded matrix doesn't wrap around at 255.
+    """
+    with np.load(path) as saved:
+        data = saved["data"]
+        if np.issubdtype(data.dtype, np.integer):
+            data = data.astype(np.int64)
+        X = sparse.csr_matrix((data, saved["indices"], saved["indptr"]), shape=tuple(saved["shape"]))
+        return X, saved["labels"].astype(np.int64), list(saved["vocabulary"])
+
+def write_feature_csv(path, X, labels, vocabulary, chunk_rows=1000):
+    """Write the old dense csv layout (one column per word plus label) a chunk of rows at a time."""
+    labels = np.asarray(labels).reshape(-1, 1)
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(list(vocabulary) + ['label']) # Write header
+        for start in range(0, X.shape[0], chunk_rows):
+            chunk = X[start:start + chunk_rows]
+            chunk = chunk.toarray() if sparse.issparse(chunk) else np.asarray(chunk) # only densify one chunk
+            writer.writerows(np.hstack((chunk, labels[start:start + chunk_rows])).tolist())
+
+def multinomial_nb_log_params(prior_spam, prior_ham, cond_prob_spam, cond_prob_ham):
+    """Stack the multinomial NB parameters into a (2,) log prior and a (features, 2) log matrix."""
+    log_prior = np.log([prior_ham, prior_spam]) # column 0 = ham, column 1 = spam
+    log_cond = np.column_stack((cond_prob_ham, cond_prob_spam)) # train_multinomial_nb already returns logs
+    return log_prior, log_cond
+
+def discrete_nb_log_params(prior, cond_prob):
+    """Fold the Bernoulli NB parameters into a (2,) bias and a (features, 2) weight matrix.
+
+    sum_j x_j log(p_j) + (1 - x_j) log(1 - p_j) = sum_j x_j (log(p_j) - log(1 - p_j)) + sum_j log(1 - p_j),
+    so the (1 - x_j) term never has to touch the data and sparse rows stay sparse.
+    """
+    cond_prob = np.asarray(cond_prob, dtype=float)
+    log_p = np.log(cond_prob)
+    log_not_p = np.log(1 - cond_prob)
+    bias = np.log(prior) + log_not_p.sum(axis=1)
+    weights = (log_p - log_not_p).T
+    return bias, weights
+
+def score_nb_batch(X, bias, weights):
+    """Score every email in X at once: returns an (emails, 2) array of [ham, spam] log scores.
+
+    X can be a dense array or a scipy sparse matrix straight from CountVectorizer.
+    """
+    if not sparse.issparse(X):
+        X = np.asarray(X)
+    return np.asarray(X @ weights) + bias
+
+def pred_multinomial_nb_batch(X_test, log_prior, log_cond):
+    """Batch version of pred_multinomial_nb using the output of multinomial_nb_log_params."""
+    scores = score_nb_batch(X_test, log_prior, log_cond)
+    return (scores[:, 1] > scores[:, 0]).astype(int) # ties go to ham, same as pred_multinomial_nb
+
+def predict_discrete_nb_batch(X_test, bias, weights):
+    """Batch version of predict_discrete_nb using the output of discrete_nb_log_params."""
+    scores = score_nb_batch(X_test, bias, weights)
+    return (scores[:, 1] >= scores[:, 0]).astype(int) # ties go to spam, same as predict_discrete_nb
+
+class NaiveBayesModel:
+    """Incremental Naive Bayes spam filter ("multinomial" or "bernoulli") that can be updated with partial_fit.
+
+    Only the sufficient statistics are stored: emails per class and, per class, the total count of each
+    word (multinomial) or the number of emails containing it (bernoulli). The log-probabilities use the
+    same Laplace smoothing as train_multinomial_nb / train_discrete_nb and are rebuilt lazily the first
+    time they are needed after an update.
+    """
+
+    def __init__(self, vocabulary, kind="multinomial"):
+        if kind not in ("multinomial", "bernoulli"):
+            raise ValueError(f"Unknown kind {kind!r}, expected 'multinomial' or 'bernoulli'")
+        self.kind = kind
+        self.vocabulary = list(vocabulary)
+        self.class_counts = np.zeros(2, dtype=np.int64) # [ham, spam] emails seen
+        self.feature_counts = np.zeros((2, len(self.vocabulary)), dtype=np.int64)
+        self._log_params = None
+
+    def partial_fit(self, X, y):
+        """Add a batch of emails (sparse or dense, emails x vocabulary) with labels 0 = ham, 1 = spam."""
+        X = sparse.csr_matrix(X)
+        if self.kind == "bernoulli":
+            X = (X > 0).astype(np.int64) # only whether the word appears matters
+        y = np.asarray(y, dtype=np.int64)
+        # (2 x emails) class indicator times X sums every class's rows in one sparse product
+        indicator = sparse.csr_matrix((np.ones(len(y), dtype=np.int64), (y, np.arange(len(y)))), shape=(2, len(y)))
+        self.feature_counts += (indicator @ X).toarray().astype(np.int64)
+        self.class_counts += np.bincount(y, minlength=2)
+        self._log_params = None
+        return self
+
+    def log_params(self):
+        """(bias, weights) for score_nb_batch, recomputed only after the counts change."""
+        if self._log_params is None:
+            num_docs = self.class_counts.sum()
+            with np.errstate(divide="ignore"): # a class with no emails yet just gets log(0) = -inf
+                if self.kind == "multinomial":
+                    num_words = len(self.vocabulary)
+                    totals = self.feature_counts.sum(axis=1) + num_words
+                    cond_prob = np.log((self.feature_counts + 1) / totals[:, None])
+                    self._log_params = multinomial_nb_log_params(self.class_counts[1] / num_docs,
+                                                                 self.class_counts[0] / num_docs,
+                                                                 cond_prob[1], cond_prob[0])
+                else:
+                    cond_prob = (self.feature_counts + 1) / (self.class_counts[:, None] + 2)
+                    self._log_params = discrete_nb_log_params(self.class_counts / num_docs, cond_prob)
+        return self._log_params
+
+    def predict(self, X):
+        if self.kind == "bernoulli":
+            if sparse.issparse(X):
+                X = (X > 0).astype(np.int64)
+            else:
+                X = (np.asarray(X) > 0).astype(np.int64)
+            return predict_discrete_nb_batch(X, *self.log_params())
+        return pred_multinomial_nb_batch(X, *self.log_params())
+
+    def save(self, path):
+        """Save the counts and vocabulary to a compressed .npz, the log-probabilities are rebuilt on load."""
+        np.savez_compressed(path, kind=self.kind, vocabulary=np.asarray(self.vocabulary, dtype=str),
+                            class_counts=self.class_counts, feature_counts=self.feature_counts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            model = cls(list(saved["vocabulary"]), kind=str(saved["kind"]))
+            model.class_counts = saved["class_counts"]
+            model.feature_counts = saved["feature_counts"]
+        return model
+
 def sigmoid(x):
     x = np.clip(x, -500, 500)  # clip x to a range that won't cause overflow
     return 1 / (1 + np.exp(-x))
@@ -179,16 +635,88 @@ def train_logistic_regression(X, y, learning_rate=.01, max_iterations=5, lambda_
         w += learning_rate * g
     return w
 
+def logistic_objective(X, y, w, lambda_reg):
+    """Negative penalized log-likelihood and its gradient, w[0] is the unpenalized bias."""
+    z = np.asarray(X @ w[1:]).ravel() + w[0] # w^Tx for every email in one product, no bias column needed
+    # log(1 + e^z) - y*z, written with logaddexp so large |z| doesn't overflow
+    loss = np.sum(np.logaddexp(0, z) - y * z) + 0.5 * lambda_reg * w[1:].dot(w[1:])
+    residual = sigmoid(z) - y
+    g = np.empty_like(w)
+    g[0] = residual.sum()
+    g[1:] = np.asarray(X.T @ residual).ravel() + lambda_reg * w[1:]
+    return loss, g
+
+def train_logistic_regression_sparse(X, y, method="batch", learning_rate=.01, max_iterations=500, lambda_reg=.1,
+                                     tol=1e-6, batch_size=256, w_init=None, random_state=None):
+    """Vectorized logistic regression that works directly on CSR matrices (dense arrays work too).
+
+    method is "batch" (full-batch gradient ascent, like train_logistic_regression), "sgd" (minibatch SGD)
+    or "lbfgs". Training stops early once the relative change in the objective drops below tol.
+    Pass the weights from a previous fit as w_init to warm start. Returns w with the bias in w[0].
+    """
+    if sparse.issparse(X):
+        X = sparse.csr_matrix(X, dtype=np.float64)
+    else:
+        X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    d, n = X.shape # d = number of samples, n = number of features
+    rng = np.random.default_rng(random_state)
+    if w_init is None:
+        w = np.zeros(n + 1)
+    else:
+        w = np.array(w_init, dtype=np.float64) # copy so the caller's weights aren't modified
+
+    if method == "lbfgs":
+        result = minimize(lambda w_: logistic_objective(X, y, w_, lambda_reg), w, jac=True, method="L-BFGS-B",
+                          options={"maxiter": max_iterations, "ftol": tol})
+        return result.x
+
+    if method not in ("batch", "sgd"):
+        raise ValueError(f"Unknown method {method!r}, expected 'batch', 'sgd' or 'lbfgs'")
+
+    prev_loss = np.inf
+    for t in range(max_iterations):
+        if method == "batch":
+            loss, g = logistic_objective(X, y, w, lambda_reg)
+            w -= learning_rate * g
+        else:
+            loss = 0.0
+            order = rng.permutation(d)
+            for start in range(0, d, batch_size):
+                rows = order[start:start + batch_size]
+                # spread the penalty over the batches so one epoch applies it once
+                batch_loss, g = logistic_objective(X[rows], y[rows], w, lambda_reg * len(rows) / d)
+                loss += batch_loss
+                w -= learning_rate * g
+        if abs(prev_loss - loss) <= tol * max(abs(loss), 1.0): # converged
+            break
+        prev_loss = loss
+    return w
+
 def predict(X, w):
-    X = np.hstack((np.ones((X.shape[0], 1)), X))  # Add bias term
-    y_pred = sigmoid(X.dot(w))  # Compute probability
+    z = np.asarray(X @ w[1:]).ravel() + w[0]  # Bias term added directly, works for sparse X
+    y_pred = sigmoid(z)  # Compute probability
     return (y_pred >= 0.5).astype(int)
 
-def findBestLamda(X_train, y_train, X_val, y_val):
+def save_logistic_regression(path, w, vocabulary, binary=False):
+    """Save trained logistic regression weights (bias in w[0]) and their vocabulary to a .npz.
+
+    binary records whether the model was trained on Bernoulli (0/1) or bag of words features.
+    """
+    np.savez(path, w=np.asarray(w, dtype=np.float64), vocabulary=np.asarray(vocabulary, dtype=str), binary=binary)
+
+def load_logistic_regression(path):
+    """Returns (w, vocabulary, binary) saved by save_logistic_regression."""
+    with np.load(path) as saved:
+        return saved["w"], list(saved["vocabulary"]), bool(saved["binary"])
+
+def findBestLamda(X_train, y_train, X_val, y_val, lambdas=None, method="lbfgs"):
+    if lambdas is None:
+        lambdas = np.logspace(-3, 2, 11)
     best_lambda = None
     best_f1 = 0
-    for lambda_reg in [0.001, 0.01, 0.1, 1]:
-        w = train_logistic_regression(X_train, y_train, lambda_reg=lambda_reg)
+    for lambda_reg in lambdas:
+        w = train_logistic_regression_sparse(X_train, y_train, method=method, lambda_reg=lambda_reg)
         y_val_pred = predict(X_val, w)
         f1 = calcf1_score(y_val, y_val_pred)
 
@@ -197,43 +725,101 @@ def findBestLamda(X_train, y_train, X_val, y_val):
             best_lambda = lambda_reg
     return best_lambda
 
+def fit_lambda_path(X_train, y_train, X_val, y_val, lambdas, method="lbfgs", max_iterations=500, tol=1e-6):
+    """Fit one fold along a descending lambda sequence, warm starting each fit from the previous weights."""
+    f1_scores = np.zeros(len(lambdas))
+    weights = np.zeros((len(lambdas), X_train.shape[1] + 1))
+    w = None
+    for i, lambda_reg in enumerate(lambdas):
+        w = train_logistic_regression_sparse(X_train, y_train, method=method, lambda_reg=lambda_reg,
+                                             max_iterations=max_iterations, tol=tol, w_init=w)
+        weights[i] = w
+        f1_scores[i] = calcf1_score(y_val, predict(X_val, w))
+    return f1_scores, weights
+
+def _fit_lambda_path_fold(args):
+    X, y, train_idx, val_idx, lambdas, method = args
+    return fit_lambda_path(X[train_idx], y[train_idx], X[val_idx], y[val_idx], lambdas, method=method)
+
+def findBestLamdaPath(X_train, y_train, lambdas=None, n_folds=5, method="lbfgs", n_jobs=None, random_state=42):
+    """Regularization-path version of findBestLamda using k-fold cross validation.
+
+    Lambdas are fit from largest to smallest so every fit warm starts from a nearby solution, and the
+    folds run in parallel in a process pool (n_jobs=1 runs them in this process). Returns the best lambda
+    and a dict with the full path: lambdas, per-fold F1 (folds x lambdas), mean F1 and the weights
+    (folds x lambdas x features + 1).
+    """
+    if lambdas is None:
+        lambdas = np.logspace(-3, 2, 50)
+    lambdas = np.sort(np.asarray(lambdas, dtype=float))[::-1] # descending
+    y_train = np.asarray(y_train)
+    if sparse.issparse(X_train):
+        X_train = sparse.csr_matrix(X_train) # row slicing for the folds
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    jobs = [(X_train, y_train, train_idx, val_idx, lambdas, method)
+            for train_idx, val_idx in folds.split(np.zeros(len(y_train)), y_train)]
+
+    if n_jobs == 1:
+        results = [_fit_lambda_path_fold(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_fit_lambda_path_fold, jobs))
+
+    f1_scores = np.array([f1 for f1, _ in results])
+    path = {
+        "lambdas": lambdas,
+        "f1": f1_scores,
+        "mean_f1": f1_scores.mean(axis=0),
+        "weights": np.array([w for _, w in results]),
+    }
+    best_lambda = lambdas[np.argmax(path["mean_f1"])]
+    return best_lambda, path
+
 def printstats(test_labels, predictions):
-    print('accuracy = ' + str(calc_accuracy(test_labels, predictions)))
-    print('precision = ' + str(calcprecision(test_labels, predictions)))
-    print('recall = ' + str(calcrecall(test_labels, predictions)))
-    print('f1_score = ' + str(calcf1_score(test_labels, predictions)))
+    metrics = classification_metrics(test_labels, predictions) # one confusion matrix for all four
+    print('accuracy = ' + str(metrics["accuracy"]))
+    print('precision = ' + str(metrics["precision"]))
+    print('recall = ' + str(metrics["recall"]))
+    print('f1_score = ' + str(metrics["f1"]))
 
 def main():
     datasets = ["enron1", "enron2", "enron4"]  # Add more as needed
     data_root = input("What is the full path, using \\\\ to specify path, of project1_datasets? ")
-    file_location_root = input("What is the absolute path of where the csv files should be located? ")
+    file_location_root = input("What is the absolute path of where the feature files should be located? ")
+    write_csv = input("Also write the feature matrices as csv files? (y/n) ").strip().lower().startswith("y")
     #max_features = int(input("Enter max number of features, w: "))
     #data_root = "C:\\project1_datasets"
 
     train_emails = ""
     test_emails = ""
     for dataset in datasets:
-        if dataset == "enron2":
-            train_dir = os.path.join(data_root, f"{dataset}_train", "train")
-            test_dir = os.path.join(data_root, f"{dataset}_test", "test")
-        else:
-            train_dir = os.path.join(data_root, f"{dataset}_train", f"{dataset}", "train")
-            test_dir = os.path.join(data_root, f"{dataset}_test", f"{dataset}", "test")
-
-
-        if not os.path.exists(train_dir) or not os.path.exists(test_dir):
-            print(f"Skipping {dataset}, directories not found")
-            continue
-
-        train_emails, train_labels = load_and_preprocess_emails(train_dir)
-        test_emails, test_labels = load_and_preprocess_emails(test_dir)
+        cache_dir = os.path.join(file_location_root, "preprocess_cache")
+        train_zip = os.path.join(data_root, f"{dataset}_train.zip")
+        test_zip = os.path.join(data_root, f"{dataset}_test.zip")
+
+        if os.path.exists(train_zip) and os.path.exists(test_zip): # read the shipped archives directly
+            train_emails, train_labels = load_and_preprocess_zip(train_zip, cache_dir=cache_dir)
+            test_emails, test_labels = load_and_preprocess_zip(test_zip, cache_dir=cache_dir)
+        else: # fall back to already extracted folders
+            if dataset == "enron2":
+                train_dir = os.path.join(data_root, f"{dataset}_train", "train")
+                test_dir = os.path.join(data_root, f"{dataset}_test", "test")
+            else:
+                train_dir = os.path.join(data_root, f"{dataset}_train", f"{dataset}", "train")
+                test_dir = os.path.join(data_root, f"{dataset}_test", f"{dataset}", "test")
+
+            if not os.path.exists(train_dir) or not os.path.exists(test_dir):
+                print(f"Skipping {dataset}, archives and directories not found")
+                continue
+
+            train_emails, train_labels = load_and_preprocess_emails(train_dir, cache_dir=cache_dir)
+            test_emails, test_labels = load_and_preprocess_emails(test_dir, cache_dir=cache_dir)
 
         print(f"Processed {len(train_emails)} training and {len(test_emails)} test emails from {dataset}")
 
 
 
-        all_words = [word for email in train_emails for word in email.split()]
-        word_features = list(FreqDist(all_words).keys())[:3000] # get features
+        word_features = build_vocabulary(train_emails, k=3000) # get features, the 3000 most frequent words
 
         vectorizer_bow = CountVectorizer(vocabulary=word_features)
         X_train_bow = vectorizer_bow.fit_transform(train_emails)
@@ -243,112 +829,51 @@ def main():
         X_train_ber = vectorizer_ber.fit_transform(train_emails)
         X_test_ber = vectorizer_ber.transform(test_emails)
 
-        X_train_ber_dense = X_train_ber.toarray()
-        X_train_bow_dense = X_train_bow.toarray()
-        X_test_bow_dense = X_test_bow.toarray()
-        X_test_ber_dense = X_test_ber.toarray()
-
-        # C:\Users\alech\PycharmProjects\NBandLR\
-        with open(os.path.join(file_location_root, f'{dataset}_bow_train.csv'), 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(list(vectorizer_bow.get_feature_names_out()) + ['label']) # Write header
-            for i in range(len(train_emails)):
-                writer.writerow(list(X_train_bow_dense[i]) + [train_labels[i]])
-
-        #C:\Users\alech\PycharmProjects\NBandLR\
-        with open(os.path.join(file_location_root, f'{dataset}_bow_test.csv'), 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(list(vectorizer_bow.get_feature_names_out()) + ['label']) # Write header
-            for i in range(len(test_emails)):
-                writer.writerow(list(X_test_bow_dense[i]) + [test_labels[i]])
-
-        # C:\Users\alech\PycharmProjects\NBandLR\
-        with open(os.path.join(file_location_root, f'{dataset}_ber_train.csv'), 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(list(vectorizer_ber.get_feature_names_out())+ ['label'])  # Write header
-            for i in range(len(train_emails)):
-                writer.writerow(list(X_train_ber_dense[i]) + [train_labels[i]])
-
-        #C:\Users\alech\PycharmProjects\NBandLR\
-        with open(os.path.join(file_location_root, f'{dataset}_ber_test.csv'), 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(list(vectorizer_ber.get_feature_names_out()) + ['label']) # Write header
-            for i in range(len(test_emails)):
-                writer.writerow(list(X_test_ber_dense[i]) + [test_labels[i]])
-
-        prior_spam, prior_ham, cond_prob_spam, cond_prob_ham = train_multinomial_nb(X_train_bow_dense, train_labels, word_features)
-
-        predictions = pred_multinomial_nb(X_test_bow_dense, prior_spam, prior_ham, cond_prob_spam, cond_prob_ham)
+        feature_names = list(vectorizer_bow.get_feature_names_out())
+        for name, X_split, split_labels in [("bow_train", X_train_bow, train_labels), ("bow_test", X_test_bow, test_labels),
+                                            ("ber_train", X_train_ber, train_labels), ("ber_test", X_test_ber, test_labels)]:
+            save_feature_matrix(os.path.join(file_location_root, f'{dataset}_{name}.npz'), X_split, split_labels, feature_names)
+            if write_csv:
+                write_feature_csv(os.path.join(file_location_root, f'{dataset}_{name}.csv'), X_split, split_labels, feature_names)
+
+        multinomial_nb = NaiveBayesModel(word_features, kind="multinomial").partial_fit(X_train_bow, train_labels)
+        multinomial_nb.save(os.path.join(file_location_root, f'{dataset}_multinomial_nb.npz'))
+        predictions = multinomial_nb.predict(X_test_bow)
 
         print("Multinomial NB")
         printstats(test_labels, predictions)
-        priors, cond_probs  = train_discrete_nb(X_train_ber_dense, train_labels, word_features)
-
-        predictions = predict_discrete_nb(X_test_ber_dense, priors, cond_probs)
+        discrete_nb = NaiveBayesModel(word_features, kind="bernoulli").partial_fit(X_train_ber, train_labels)
+        discrete_nb.save(os.path.join(file_location_root, f'{dataset}_discrete_nb.npz'))
+        predictions = discrete_nb.predict(X_test_ber)
 
         print("Discrete NB")
         printstats(test_labels, predictions)
 
-        X_train, X_valid_bow, y_train , y_val = train_test_split(X_train_ber_dense, train_labels, test_size=.3, random_state=42)
-        best_lambda_bow = findBestLamda(X_train, y_train, X_valid_bow, y_val)
-        final_w_bow = train_logistic_regression(X_train_bow_dense, train_labels, lambda_reg=best_lambda_bow)
-        y_test_pred_bow = predict(X_test_bow_dense, final_w_bow)
+        best_lambda_bow, _ = findBestLamdaPath(X_train_bow, train_labels)
+        final_w_bow = train_logistic_regression_sparse(X_train_bow, train_labels, method="lbfgs", lambda_reg=best_lambda_bow)
+        save_logistic_regression(os.path.join(file_location_root, f'{dataset}_lr_bow.npz'), final_w_bow, word_features)
+        y_test_pred_bow = predict(X_test_bow, final_w_bow)
         print("Logistic Regression Performance for Bag of Words:")
         printstats(test_labels, y_test_pred_bow)
-        X_train, X_valid_ber, y_train, y_val = train_test_split(X_train_ber_dense, train_labels, test_size=0.3, random_state=42)
-        best_lambda_ber= findBestLamda(X_train, y_train, X_valid_ber, y_val)
-        final_w_bow = train_logistic_regression(X_train_bow_dense, train_labels, lambda_reg=best_lambda_ber)
-        y_test_pred_ber = predict(X_test_ber_dense, final_w_bow)
+        best_lambda_ber, _ = findBestLamdaPath(X_train_ber, train_labels)
+        final_w_ber = train_logistic_regression_sparse(X_train_ber, train_labels, method="lbfgs", lambda_reg=best_lambda_ber)
+        save_logistic_regression(os.path.join(file_location_root, f'{dataset}_lr_ber.npz'), final_w_ber, word_features, binary=True)
+        y_test_pred_ber = predict(X_test_ber, final_w_ber)
         print("Logistic Regression Performance for Bernoulli:")
         printstats(test_labels, y_test_pred_ber)
 
 def calc_accuracy(test_labels, predictions):
-    correct = 0
-    for i in range(len(predictions)):
-        if test_labels[i] ==  predictions[i]:
-            correct+=1
-
-    return correct / (len(predictions))
+    return classification_metrics(test_labels, predictions)["accuracy"]
 
 def calcprecision(test_labels, predictions):
-    true_pos = 0
-    false_pos = 0
-    for i in range(len(predictions)):
-        if test_labels[i] == 1 and predictions[i] == 1:
-            true_pos+=1
-        elif test_labels[i] == 0 and predictions[i] == 1:
-            false_pos+=1
-    if true_pos+false_pos==0:
-        return 0.0
-    return true_pos / (true_pos+false_pos)
+    return classification_metrics(test_labels, predictions)["precision"]
 
 def calcrecall(test_labels, predictions):
-    true_pos = 0
-    false_neg = 0
-    for i in range(len(predictions)):
-        if test_labels[i] == 1 and predictions[i] == 1:
-            true_pos+=1
-        elif test_labels[i] == 1 and predictions[i] == 0:
-            false_neg+=1
-    if true_pos + false_neg == 0:
-        return 0.0
-    return true_pos / (true_pos+false_neg)
+    return classification_metrics(test_labels, predictions)["recall"]
 
 def calcf1_score(test_labels, predictions):
-    precision = calcprecision(test_labels, predictions)
-    recall = calcrecall(test_labels, predictions)
-    if precision + recall == 0:
-        return 0.0
-    return 2 *  ( (precision * recall) / (precision + recall) )
-
-
-main()
-
-
-
-
-
-
-
+    return classification_metrics(test_labels, predictions)["f1"]
 
 
+if __name__ == "__main__": # keeps process pool workers from re-running main() on import
+    main()
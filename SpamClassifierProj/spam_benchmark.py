@@ -0,0 +1,185 @@
+import argparse
+import cProfile
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from initial import (NaiveBayesModel, build_vocabulary, predict, preprocess_texts,
+                     train_logistic_regression_sparse)
+from spam_metrics import classification_metrics
+
+
+def make_vocabulary(size, seed=0):
+    """size distinct lowercase pseudo-words of 3-10 letters."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = set()
+    while len(words) < size:
+        length = rng.integers(3, 11)
+        words.add("".join(rng.choice(letters, size=length)))
+    return sorted(words)
+
+
+def make_corpus(num_emails, vocab_size=20000, mean_length=150, spam_fraction=0.3, seed=0):
+    """Synthetic emails with Zipf-distributed words, where spam over-uses a random subset of the vocabulary.
+
+    Returns (raw email texts, labels).
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(vocab_size, seed))
+    ham_p = 1 / np.arange(1, vocab_size + 1) ** 1.1
+    spam_p = ham_p * np.where(rng.random(vocab_size) < 0.05, 1.5, 1.0) # 5% of words are "spammy"
+    ham_p /= ham_p.sum()
+    spam_p /= spam_p.sum()
+
+    labels = (rng.random(num_emails) < spam_fraction).astype(int)
+    lengths = rng.poisson(mean_length, num_emails) + 1
+    emails = []
+    for label, length in zip(labels, lengths):
+        words = rng.choice(vocabulary, size=length, p=spam_p if label else ham_p)
+        emails.append("Subject: " + " ".join(words) + ".")
+    return emails, labels.tolist()
+
+
+def run_stage(results, name, func, num_emails, num_bytes=None, profile_dir=None, measure_memory=True):
+    """Time func(), recording wall time, throughput and peak memory under results[name].
+
+    The timed run has neither tracemalloc nor cProfile on, their hooks would slow the stage down and
+    inflate the seconds --compare checks. Peak memory comes from a second, untimed run under tracemalloc,
+    which only sees the parent process: memory used inside pool workers (preprocess and vocabulary with
+    n_jobs != 1) is not counted. With a profile_dir the stage runs once more, untimed, under cProfile.
+    """
+    start = time.perf_counter()
+    output = func()
+    seconds = time.perf_counter() - start
+
+    if profile_dir:
+        profiler = cProfile.Profile()
+        profiler.runcall(func)
+        profiler.dump_stats(f"{profile_dir}/{name}.prof")
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    results[name] = {
+        "seconds": seconds,
+        "emails_per_s": num_emails / seconds if seconds > 0 else float("inf"),
+        "peak_mb": peak / 2**20 if peak is not None else None,
+    }
+    if num_bytes is not None:
+        results[name]["mb_per_s"] = num_bytes / 2**20 / seconds if seconds > 0 else float("inf")
+    memory = f"{results[name]['peak_mb']:9.1f} MB peak" if peak is not None else ""
+    print(f"{name:<22} {seconds:9.3f} s {results[name]['emails_per_s']:12.0f} emails/s {memory}")
+    return output
+
+
+def run_benchmark(num_emails, vocab_size, mean_length, num_features, n_jobs, seed, skip_preprocess, profile_dir,
+                  measure_memory=True):
+    emails, labels = make_corpus(num_emails, vocab_size, mean_length, seed=seed)
+    num_bytes = sum(len(email.encode("utf-8")) for email in emails)
+    split = int(0.8 * num_emails)
+    stages = {}
+
+    if skip_preprocess:
+        processed = [email.lower().replace("subject:", "").rstrip(".") for email in emails]
+    else:
+        processed = run_stage(stages, "preprocess", lambda: preprocess_texts(emails, n_jobs=n_jobs),
+                              num_emails, num_bytes, profile_dir, measure_memory)
+    train_emails, test_emails = processed[:split], processed[split:]
+    train_labels, test_labels = labels[:split], labels[split:]
+
+    vocabulary = run_stage(stages, "vocabulary", lambda: build_vocabulary(train_emails, k=num_features, n_jobs=n_jobs),
+                           split, profile_dir=profile_dir, measure_memory=measure_memory)
+    vectorizer = CountVectorizer(vocabulary=vocabulary)
+    X_train = run_stage(stages, "vectorize_train", lambda: vectorizer.fit_transform(train_emails),
+                        split, profile_dir=profile_dir, measure_memory=measure_memory)
+    X_test = vectorizer.transform(test_emails)
+
+    nb = run_stage(stages, "nb_train", lambda: NaiveBayesModel(vocabulary).partial_fit(X_train, train_labels),
+                   split, profile_dir=profile_dir, measure_memory=measure_memory)
+    nb_pred = run_stage(stages, "nb_predict", lambda: nb.predict(X_test), len(test_labels),
+                        profile_dir=profile_dir, measure_memory=measure_memory)
+    w = run_stage(stages, "lr_train", lambda: train_logistic_regression_sparse(X_train, train_labels, method="lbfgs"),
+                  split, profile_dir=profile_dir, measure_memory=measure_memory)
+    lr_pred = run_stage(stages, "lr_predict", lambda: predict(X_test, w), len(test_labels),
+                        profile_dir=profile_dir, measure_memory=measure_memory)
+    run_stage(stages, "metrics", lambda: classification_metrics(test_labels, lr_pred), len(test_labels),
+              profile_dir=profile_dir, measure_memory=measure_memory)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "config": {"num_emails": num_emails, "vocab_size": vocab_size, "mean_length": mean_length,
+                   "num_features": num_features, "n_jobs": n_jobs, "seed": seed, "corpus_mb": num_bytes / 2**20},
+        "f1": {"nb": classification_metrics(test_labels, nb_pred)["f1"],
+               "lr": classification_metrics(test_labels, lr_pred)["f1"]},
+        "stages": stages,
+    }
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Print the time ratio of every stage against a baseline run. Returns the names of regressed stages.
+
+    A stage only counts as regressed if it is both threshold slower and min_seconds slower, so timer
+    noise on millisecond stages doesn't fail the comparison.
+    """
+    regressions = []
+    print(f"\n{'stage':<22} {'baseline s':>10} {'current s':>10} {'ratio':>7}")
+    for name, current in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        before = baseline["stages"][name]["seconds"]
+        ratio = current["seconds"] / before if before > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and current["seconds"] - before > min_seconds:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<22} {before:10.3f} {current['seconds']:10.3f} {ratio:7.2f}{flag}")
+    if baseline.get("config") != results.get("config"):
+        print("note: baseline was run with a different config, ratios are not like-for-like")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the spam classification pipeline.")
+    parser.add_argument("--emails", type=int, default=20000)
+    parser.add_argument("--vocab-size", type=int, default=20000)
+    parser.add_argument("--mean-length", type=int, default=150, help="mean words per email")
+    parser.add_argument("--features", type=int, default=3000)
+    parser.add_argument("--n-jobs", type=int, default=None, help="pool size for preprocessing and vocabulary")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-preprocess", action="store_true", help="skip the NLTK stage (no corpora needed)")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the second, tracemalloc run of each stage")
+    parser.add_argument("--profile-dir", help="also write a cProfile .prof file per stage here, from an extra untimed run")
+    parser.add_argument("--output", default="spam_benchmark.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.emails, args.vocab_size, args.mean_length, args.features, args.n_jobs,
+                            args.seed, args.skip_preprocess, args.profile_dir, not args.skip_memory)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_seconds)
+        if regressions:
+            raise SystemExit(f"Regressed stages: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def _encode_labels(y_true, y_pred, labels=None):
+    """Map labels to 0..k-1 column indices. Returns (true indices, predicted indices, labels)."""
+    y_true = np.asarray(y_true).ravel()
+    y_pred = np.asarray(y_pred).ravel()
+    if labels is None:
+        if np.issubdtype(y_true.dtype, np.integer) and np.issubdtype(y_pred.dtype, np.integer) \
+                and y_true.size and min(y_true.min(), y_pred.min()) >= 0:
+            # 0/1 spam labels (and ints that are exactly 0..k-1) index the matrix directly. Any other
+            # ints would add columns for labels that never occur, so they go through np.unique below
+            k = int(max(y_true.max(), y_pred.max(), 1)) + 1
+            if k == 2 or (k <= y_true.size + y_pred.size and _covers_range(y_true, y_pred, k)):
+                return y_true, y_pred, np.arange(k)
+        labels = np.unique(np.concatenate((y_true, y_pred)))
+        return np.searchsorted(labels, y_true), np.searchsorted(labels, y_pred), labels
+    labels = np.asarray(labels)
+    index = _label_index(labels)
+    return _lookup(index, y_true), _lookup(index, y_pred), labels
+
+
+def _covers_range(y_true, y_pred, k):
+    """Whether every int in 0..k-1 occurs in y_true or y_pred."""
+    return bool(np.all((np.bincount(y_true, minlength=k) > 0) | (np.bincount(y_pred, minlength=k) > 0)))
+
+
+def _label_index(labels):
+    """{label: column} for labels in the order given, which need not be sorted."""
+    index = {label: i for i, label in enumerate(labels.tolist())}
+    if len(index) != len(labels):
+        raise ValueError(f"labels contains duplicates: {list(labels)}")
+    return index
+
+
+def _lookup(index, values):
+    # one dict lookup per distinct value, then broadcast back through the inverse
+    distinct, inverse = np.unique(values, return_inverse=True)
+    unknown = [value for value in distinct.tolist() if value not in index]
+    if unknown:
+        raise ValueError(f"{unknown} not in labels {list(index)}")
+    return np.array([index[value] for value in distinct.tolist()], dtype=np.intp)[inverse.ravel()]
+
+
+def _bincount_confusion(true_idx, pred_idx, k):
+    return np.bincount(true_idx * k + pred_idx, minlength=k * k).reshape(k, k)
+
+
+def confusion_matrix(y_true, y_pred, labels=None):
+    """Confusion matrix in one bincount pass: rows are true labels, columns are predictions."""
+    true_idx, pred_idx, labels = _encode_labels(y_true, y_pred, labels)
+    return _bincount_confusion(true_idx, pred_idx, len(labels))
+
+
+def metrics_from_confusion(cm, average="binary", pos_label=1):
+    """Accuracy, precision, recall and F1 from a confusion matrix.
+
+    average is "binary" (scores for the class in row/column pos_label only, like calcprecision/calcrecall),
+    "macro", "weighted" or "micro". Any 0/0 ratio counts as 0.0, the same as the original loop-based functions.
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diag(cm)
+    predicted = cm.sum(axis=0) # tp + fp per class
+    actual = cm.sum(axis=1) # tp + fn per class
+    total = cm.sum()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(actual > 0, tp / actual, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    if average == "binary":
+        precision, recall, f1 = precision[pos_label], recall[pos_label], f1[pos_label]
+    elif average == "macro":
+        precision, recall, f1 = precision.mean(), recall.mean(), f1.mean()
+    elif average == "weighted":
+        weights = actual / total if total else np.zeros_like(actual)
+        precision, recall, f1 = precision @ weights, recall @ weights, f1 @ weights
+    elif average == "micro":
+        precision = recall = f1 = tp.sum() / total if total else 0.0 # single-label: all equal accuracy
+    else:
+        raise ValueError(f"Unknown average {average!r}, expected 'binary', 'macro', 'weighted' or 'micro'")
+
+    return {
+        "accuracy": float(tp.sum() / total) if total else 0.0,
+        "precision": float(precision),
+        "recall": float(recall),
+        "f1": float(f1),
+    }
+
+
+def classification_metrics(y_true, y_pred, average="binary", pos_label=1, labels=None):
+    """All metrics from a single confusion matrix pass over the predictions."""
+    true_idx, pred_idx, labels = _encode_labels(y_true, y_pred, labels)
+    cm = _bincount_confusion(true_idx, pred_idx, len(labels))
+    pos_index = 0
+    if average == "binary":
+        if pos_label not in labels:
+            raise ValueError(f"pos_label {pos_label!r} is not one of the labels {list(labels)}")
+        pos_index = int(np.flatnonzero(labels == pos_label)[0])
+    return metrics_from_confusion(cm, average=average, pos_label=pos_index)
+
+
+class ConfusionAccumulator:
+    """Streaming confusion matrix: update() with each batch, then metrics() over everything seen so far."""
+
+    def __init__(self, labels):
+        self.labels = np.asarray(labels)
+        self._index = _label_index(self.labels)
+        self.cm = np.zeros((len(self.labels), len(self.labels)), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        true_idx = _lookup(self._index, np.asarray(y_true).ravel())
+        pred_idx = _lookup(self._index, np.asarray(y_pred).ravel())
+        self.cm += _bincount_confusion(true_idx, pred_idx, len(self.labels))
+        return self
+
+    def metrics(self, average="binary", pos_label=1):
+        return metrics_from_confusion(self.cm, average=average, pos_label=pos_label)
+
+
+def threshold_sweep(y_true, scores, pos_label=1):
+    """TP/FP counts at every distinct score threshold from one sort of the scores.
+
+    Returns (thresholds in descending order, tp, fp, total positives, total negatives), where tp[i]/fp[i]
+    count the examples with score >= thresholds[i].
+    """
+    positive = np.asarray(y_true).ravel() == pos_label
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    order = np.argsort(-scores, kind="mergesort")
+    scores, positive = scores[order], positive[order]
+    # last index of each run of equal scores, so tied examples are always on the same side
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.cumsum(positive)[last]
+    fp = (last + 1) - tp
+    return scores[last], tp, fp, int(positive.sum()), int((~positive).sum())
+
+
+def roc_curve(y_true, scores, pos_label=1):
+    """(false positive rate, true positive rate, thresholds), starting from the (0, 0) point."""
+    thresholds, tp, fp, pos, neg = threshold_sweep(y_true, scores, pos_label)
+    tpr = np.r_[0, tp] / pos if pos else np.zeros(len(tp) + 1)
+    fpr = np.r_[0, fp] / neg if neg else np.zeros(len(fp) + 1)
+    return fpr, tpr, np.r_[np.inf, thresholds]
+
+
+def precision_recall_curve(y_true, scores, pos_label=1):
+    """(precision, recall, thresholds) with thresholds in descending order."""
+    thresholds, tp, fp, pos, _ = threshold_sweep(y_true, scores, pos_label)
+    precision = tp / (tp + fp)
+    recall = tp / pos if pos else np.zeros(len(tp))
+    return precision, recall, thresholds
+
+
+def roc_auc(y_true, scores, pos_label=1):
+    fpr, tpr, _ = roc_curve(y_true, scores, pos_label)
+    return float(np.trapezoid(tpr, fpr)) if hasattr(np, "trapezoid") else float(np.trapz(tpr, fpr))
+
+
+def average_precision(y_true, scores, pos_label=1):
+    """Area under the precision-recall curve as the precision-weighted sum of recall steps."""
+    precision, recall, _ = precision_recall_curve(y_true, scores, pos_label)
+    return float(np.sum(np.diff(np.r_[0, recall]) * precision))
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from initial import (NaiveBayesModel, _init_preprocess_worker, load_logistic_regression, preprocess_email,
+                     score_nb_batch, sigmoid)
+
+
+def load_scorer(model_path):
+    """Load a model saved by initial.py (NaiveBayesModel.save or save_logistic_regression).
+
+    Returns (vectorizer, score_batch) where score_batch takes the vectorized emails and returns
+    (predictions, spam scores). The vocabulary index is built here once and reused for every request.
+    """
+    with np.load(model_path) as saved:
+        is_nb = "kind" in saved.files
+
+    if is_nb:
+        model = NaiveBayesModel.load(model_path)
+        vectorizer = CountVectorizer(vocabulary=model.vocabulary, binary=model.kind == "bernoulli")
+        model.log_params() # build the log-probabilities now instead of on the first request
+
+        spam_on_tie = model.kind == "bernoulli" # the same tie rules as model.predict
+
+        def score_batch(X):
+            scores = score_nb_batch(X, *model.log_params())
+            log_odds = scores[:, 1] - scores[:, 0] # spam vs ham
+            return (log_odds >= 0 if spam_on_tie else log_odds > 0).astype(int), log_odds
+    else:
+        w, vocabulary, binary = load_logistic_regression(model_path)
+        vectorizer = CountVectorizer(vocabulary=vocabulary, binary=binary)
+
+        def score_batch(X):
+            p = sigmoid(np.asarray(X @ w[1:]).ravel() + w[0]) # P(spam), the same threshold as predict
+            return (p >= 0.5).astype(int), p
+    return vectorizer, score_batch
+
+
+class MicroBatcher:
+    """Collects emails from concurrent requests and scores them together in one vectorized call.
+
+    A batch is scored as soon as it reaches max_batch emails or max_delay seconds after its first email.
+    """
+
+    def __init__(self, vectorizer, score_batch, max_batch=256, max_delay=0.001):
+        self.vectorizer = vectorizer
+        self.score_batch = score_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, processed_emails):
+        """Queue a list of preprocessed emails; the Future resolves to (predictions, scores)."""
+        future = Future()
+        self.requests.put((processed_emails, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()] # block until there is work
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                size += len(batch[-1][0])
+
+            emails = [email for processed_emails, _ in batch for email in processed_emails]
+            try:
+                predictions, scores = self.score_batch(self.vectorizer.transform(emails))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for processed_emails, future in batch: # hand every request back its own slice
+                end = start + len(processed_emails)
+                future.set_result((predictions[start:end], scores[start:end]))
+                start = end
+
+
+class LatencyStats:
+    """Request counters plus p50/p99 latency over the most recent requests."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.messages = 0
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def record(self, seconds, messages):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.messages += messages
+
+    def report(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            requests, messages = self.requests, self.messages
+        elapsed = time.perf_counter() - self.started
+        report = {"requests": requests, "messages": messages, "uptime_s": elapsed,
+                  "messages_per_s": messages / elapsed if elapsed > 0 else 0.0}
+        if len(latencies):
+            report["p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+            report["p99_ms"] = float(np.percentile(latencies, 99) * 1000)
+            report["per_message_ms"] = float(latencies.sum() * 1000 / max(messages, 1))
+        return report
+
+
+def make_handler(batcher, stats):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        """POST /classify with {"email": "..."} or {"emails": [...]}, add "preprocessed": true to skip
+        preprocess_email. GET /stats returns the latency and throughput counters."""
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, stats.report())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/classify":
+                self._send(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                emails = body["emails"] if "emails" in body else [body["email"]]
+            except (ValueError, KeyError, TypeError):
+                self._send(400, {"error": "expected a JSON body with 'email' or 'emails'"})
+                return
+            if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+                self._send(400, {"error": "'email' must be a string and 'emails' a list of strings"})
+                return
+            try:
+                if not body.get("preprocessed", False):
+                    emails = [preprocess_email(email) for email in emails]
+                predictions, scores = batcher.submit(emails).result()
+            except Exception as e: # still answer, instead of dropping the connection with the handler thread
+                self._send(500, {"error": f"scoring failed: {type(e).__name__}: {e}"})
+                return
+            stats.record(time.perf_counter() - start, len(emails))
+            self._send(200, {"predictions": predictions.tolist(), "scores": scores.tolist()})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass # per-request logging would cost more than the scoring itself
+
+    return ScoringHandler
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 1024 # the default listen backlog of 5 resets connections under concurrent load
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0) # BaseHTTPRequestHandler expects a (host, port) client address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a trained spam classifier over HTTP.")
+    parser.add_argument("model", help="a *_nb.npz or *_lr_*.npz file written by initial.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="listen on this Unix socket path instead of host/port")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-delay-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    vectorizer, score_batch = load_scorer(args.model)
+    try:
+        # load the NLTK stopwords, tokenizer and lemmatizer now, not lazily from racing handler threads,
+        # and refuse to start without them instead of answering every request with a 500
+        _init_preprocess_worker()
+        preprocess_email("Subject: warming up the tokenizer and lemmatizer before the first requests.")
+    except Exception as e:
+        raise SystemExit(f"Preprocessing doesn't work, is the NLTK data installed? {type(e).__name__}: {e}")
+    batcher = MicroBatcher(vectorizer, score_batch, max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000)
+    handler = make_handler(batcher, LatencyStats())
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        server = ThreadingUnixHTTPServer(args.unix_socket, handler)
+        print(f"Serving {args.model} on unix socket {args.unix_socket}")
+    else:
+        server = ScoringHTTPServer((args.host, args.port), handler)
+        print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
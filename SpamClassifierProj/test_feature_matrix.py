@@ -0,0 +1,20 @@
+import numpy as np
+from scipy import sparse
+
+from initial import load_feature_matrix, save_feature_matrix
+
+
+def test_round_trip_keeps_values_and_room_for_arithmetic(tmp_path):
+    X = sparse.csr_matrix(np.array([[200, 0, 3], [0, 255, 1]], dtype=np.int64))
+    labels = np.array([1, 0])
+    path = tmp_path / "features.npz"
+    save_feature_matrix(path, X, labels, ["free", "money", "now"])
+
+    loaded, loaded_labels, vocabulary = load_feature_matrix(path)
+    assert vocabulary == ["free", "money", "now"]
+    assert (loaded != X).nnz == 0
+    assert loaded.dtype == np.int64 and loaded_labels.dtype == np.int64
+    # counts are stored as uint8 on disk, sums and products must not wrap
+    assert (loaded + loaded)[0, 0] == 400
+    assert (loaded.T @ loaded)[1, 1] == 255 * 255
+    assert (loaded_labels - 2).tolist() == [-1, -2]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from sklearn.metrics import f1_score, precision_score, recall_score
+
+from spam_metrics import classification_metrics, confusion_matrix
+
+
+@pytest.mark.parametrize("y_true, y_pred", [
+    ([1, 2, 3], [1, 2, 3]), # no 0
+    ([5, 7, 5], [5, 7, 5]), # gaps below and between the labels
+    ([0, 2, 2, 0], [2, 2, 0, 0]),
+    ([0, 1, 2, 1], [0, 2, 2, 1]), # exactly 0..k-1, the direct indexing path
+])
+def test_macro_only_counts_labels_that_occur(y_true, y_pred):
+    metrics = classification_metrics(y_true, y_pred, average="macro")
+    assert metrics["precision"] == pytest.approx(precision_score(y_true, y_pred, average="macro", zero_division=0))
+    assert metrics["recall"] == pytest.approx(recall_score(y_true, y_pred, average="macro", zero_division=0))
+    assert metrics["f1"] == pytest.approx(f1_score(y_true, y_pred, average="macro", zero_division=0))
+
+
+def test_perfect_predictions_with_gaps_score_one():
+    assert classification_metrics([1, 2, 3], [1, 2, 3], average="macro")["f1"] == 1.0
+    assert classification_metrics([5, 7, 5], [5, 7, 5], average="macro")["f1"] == 1.0
+
+
+def test_sparse_large_label_keeps_the_matrix_small():
+    cm = confusion_matrix([0, 100000], [0, 100000])
+    assert cm.shape == (2, 2)
+    assert classification_metrics([0, 100000], [0, 100000], average="macro")["f1"] == 1.0
+
+
+def test_binary_spam_labels_keep_both_columns():
+    # all-ham predictions still have a spam column for pos_label=1
+    assert confusion_matrix(np.array([0, 0, 1]), np.array([0, 0, 0])).tolist() == [[2, 0], [1, 0]]
+    assert classification_metrics([0, 0], [0, 0])["f1"] == 0.0
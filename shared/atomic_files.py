@@ -0,0 +1,29 @@
+import json
+import os
+
+import numpy as np
+
+# Imported by mnist_store and Ensemble_Learning_Proj, which add this folder to sys.path
+
+
+def save_npy(path, array):
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path) # readers never see a half-written file
+
+
+def save_json(path, value):
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(path + ".tmp", path)
+
+
+def save_cache(arrays, meta_path, meta):
+    """Save every {path: array} as .npy, then meta as JSON at meta_path.
+
+    Readers only trust a cache whose meta file exists, and it is written last, so it only exists once
+    all of the arrays do.
+    """
+    for path, array in arrays.items():
+        save_npy(path, array)
+    save_json(meta_path, meta)
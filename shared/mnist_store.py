@@ -0,0 +1,63 @@
+import json
+import os
+
+import numpy as np
+from sklearn.datasets import fetch_openml, get_data_home
+
+from atomic_files import save_cache
+
+# Imported by Ensemble_Learning_Proj and SVM_kernel_Proj, which add this folder to sys.path
+STORE_NAME = "mnist_784_uint8"
+STORE_VERSION = 1 # bump when the stored layout changes
+
+
+def store_dir(data_home=None):
+    """Where the store lives: sklearn's data home (~/scikit_learn_data or $SCIKIT_LEARN_DATA) by default."""
+    return os.path.join(get_data_home(data_home), STORE_NAME)
+
+
+def build_store(data_home=None):
+    """Fetch mnist_784 once (fetch_openml reuses its own download if there is one) and save the
+    pixels as uint8 and the labels as int64."""
+    directory = store_dir(data_home)
+    X, y = fetch_openml("mnist_784", version=1, return_X_y=True, as_frame=False, data_home=data_home)
+    os.makedirs(directory, exist_ok=True)
+    save_cache({os.path.join(directory, "X.npy"): X.astype(np.uint8), # pixels are whole numbers 0-255
+                os.path.join(directory, "y.npy"): y.astype(np.int64)},
+               os.path.join(directory, "meta.json"), {"version": STORE_VERSION, "shape": [len(y), 784]})
+
+
+def load_mnist(data_home=None, download=True):
+    """(X, y) for all 70,000 MNIST digits, X as a read-only (70000, 784) uint8 memmap of raw 0-255 pixels.
+
+    Only the first call needs the network (or fetch_openml's cache), later ones just map the file, so
+    nothing is parsed or copied until rows are actually used. Pass download=False to fail instead of fetching.
+    """
+    directory = store_dir(data_home)
+    meta_path = os.path.join(directory, "meta.json")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is None or meta.get("version") != STORE_VERSION:
+        if not download:
+            raise FileNotFoundError(f"No MNIST store in {directory}, run with download=True once")
+        build_store(data_home)
+    return np.load(os.path.join(directory, "X.npy"), mmap_mode="r"), np.load(os.path.join(directory, "y.npy"))
+
+
+def iter_scaled(X, rows=None, chunk_rows=8192, scale=255.0, dtype=np.float32):
+    """Yield (start, X[rows][start:start + chunk_rows] / scale) one chunk at a time as dtype."""
+    rows = np.arange(X.shape[0]) if rows is None else np.asarray(rows)
+    for start in range(0, len(rows), chunk_rows):
+        yield start, np.divide(X[rows[start:start + chunk_rows]], scale, dtype=dtype)
+
+
+def scaled(X, rows=None, chunk_rows=8192, scale=255.0, dtype=np.float32):
+    """X[rows] / scale as one dtype array, filled a chunk at a time so neither a float64 copy nor a
+    full-size copy of the uint8 rows is ever made. scale=1 keeps the raw pixel values."""
+    rows = np.arange(X.shape[0]) if rows is None else np.asarray(rows)
+    out = np.empty((len(rows), X.shape[1]), dtype=dtype)
+    for start in range(0, len(rows), chunk_rows):
+        np.divide(X[rows[start:start + chunk_rows]], scale, out=out[start:start + chunk_rows], dtype=dtype)
+    return out